@@ -1,18 +1,416 @@
-from flask import Flask, request, jsonify
-import socket
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import asyncio
+import json
+import queue
+import threading
+import time
+import uuid
+import logging
+from portprobe import get_engine, clamp_timeout, make_result, ERROR, TIMEOUT, MAX_ATTEMPTS, MAX_PORT
+from metrics import Counter, Gauge, Histogram, render
+from logsetup import setup_logging
 
 app = Flask(__name__)
 
-def is_port_open(ip, port):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(1)  # 设置超时时间
-    try:
-        sock.connect((ip, port))
-        return True
-    except socket.error:
-        return False
-    finally:
-        sock.close()
+# 批量检测的限制
+MAX_BATCH_TARGETS = 5000  # 单次请求最多检测的目标数
+DEFAULT_BATCH_CONCURRENCY = 256  # 默认并发数
+MAX_BATCH_CONCURRENCY = 2048  # 并发上限
+
+# 结果缓存配置
+CACHE_MAXSIZE = 100000  # 最多缓存的 (ip, port) 数
+CACHE_OPEN_TTL = 30  # 端口开放结果的缓存时间（秒）
+CACHE_CLOSED_TTL = 5  # 端口关闭/超时结果的缓存时间（秒），尽快发现恢复
+
+# 目标订阅配置
+MAX_WATCHES = 1000  # 最多同时存在的订阅数
+MAX_CLIENT_WATCHES = 10  # 单个客户端最多同时存在的订阅数
+WATCH_CONCURRENCY = 128  # 单个订阅同时提交给 scheduler 的探测数，客户端的订阅全部排队时也不超过它的排队上限
+DEFAULT_WATCH_INTERVAL = 10  # 默认探测间隔（秒）
+MIN_WATCH_INTERVAL = 1  # 最小探测间隔（秒）
+WATCH_IDLE_TTL = 600  # 没有订阅者连接超过这么久（秒）的订阅自动删除
+SSE_KEEPALIVE = 15  # SSE 心跳间隔（秒），防止代理断开空闲连接
+SUBSCRIBER_QUEUE_SIZE = 1000  # 每个订阅者最多积压的事件数，超出后丢弃新事件
+
+# 准入控制与公平调度配置
+SCHED_MAX_RUNNING = 2048  # 全局同时执行的探测任务数
+SCHED_CLIENT_RUNNING = 256  # 单个客户端同时执行的探测任务数
+SCHED_MAX_QUEUED = 10000  # 全局排队上限，超出后立即返回 429
+SCHED_CLIENT_QUEUED = 2048  # 单个客户端排队上限
+CLIENT_ID_HEADER = 'X-Client-Id'  # 客户端标识，缺省时使用来源 IP
+
+engine = get_engine()
+
+# 监控指标
+REQUESTS = Counter('apiport_requests_total', 'HTTP requests by endpoint and status code', ['endpoint', 'code'])
+REQUEST_LATENCY = Histogram('apiport_request_duration_seconds',
+                            'Time until the response (or its first byte for streams) is ready', ['endpoint'])
+CACHE_LOOKUPS = Counter('apiport_cache_lookups_total', 'Result cache lookups by outcome (hit/miss/coalesced)', ['result'])
+SCHED_REJECTED = Counter('apiport_scheduler_rejected_total', 'Probe jobs rejected by admission control', ['reason'])
+
+
+class Rejected(Exception):
+    """排队已满，探测任务被拒绝"""
+
+
+class FairScheduler:
+    """按客户端公平调度探测任务。
+
+    每个客户端有独立的排队和并发上限，空闲槽位按轮询顺序分给有任务排队的客户端，
+    单个客户端刷请求时只会占满自己的份额；队列满时 submit 立即抛出 Rejected。
+    """
+
+    def __init__(self, max_running=SCHED_MAX_RUNNING, client_running=SCHED_CLIENT_RUNNING,
+                 max_queued=SCHED_MAX_QUEUED, client_queued=SCHED_CLIENT_QUEUED):
+        self.max_running = max_running
+        self.client_running = client_running
+        self.max_queued = max_queued
+        self.client_queued = client_queued
+        self._queues = OrderedDict()  # 客户端 -> deque[(start_fn, Future)]，顺序即轮询顺序
+        self._running = {}  # 客户端 -> 正在执行的任务数
+        self.running = 0
+        self.queued = 0
+        self._lock = threading.Lock()
+
+    def submit(self, client, start_fn):
+        """排队一个任务，start_fn() 需返回 concurrent.futures.Future；返回任务结果的 Future"""
+        future = Future()
+        with self._lock:
+            client_queue = self._queues.get(client)
+            if self.queued >= self.max_queued:
+                SCHED_REJECTED.inc('queue_full')
+                raise Rejected('Server busy, probe queue is full')
+            if client_queue is not None and len(client_queue) >= self.client_queued:
+                SCHED_REJECTED.inc('client_queue_full')
+                raise Rejected('Too many queued probes for this client')
+            if client_queue is None:
+                client_queue = self._queues[client] = deque()
+            client_queue.append((start_fn, future))
+            self.queued += 1
+            jobs = self._dispatch()
+        self._start(jobs)
+        return future
+
+    def _dispatch(self):
+        """在持有锁时调用，按轮询顺序取出可以执行的任务"""
+        jobs = []
+        while self.running < self.max_running:
+            for client, client_queue in self._queues.items():
+                if client_queue and self._running.get(client, 0) < self.client_running:
+                    break
+            else:
+                break
+            start_fn, future = client_queue.popleft()
+            self._queues.move_to_end(client)  # 轮到的客户端排到最后，空队列在任务结束时清理
+            self._running[client] = self._running.get(client, 0) + 1
+            self.running += 1
+            self.queued -= 1
+            jobs.append((client, start_fn, future))
+        return jobs
+
+    def _start(self, jobs):
+        for client, start_fn, future in jobs:
+            try:
+                inner = start_fn()
+            except Exception as e:
+                self._done(client, future, None, e)
+                continue
+            inner.add_done_callback(lambda f, client=client, future=future: self._done(client, future, f))
+
+    def _done(self, client, future, inner, error=None):
+        with self._lock:
+            self.running -= 1
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+                if not self._queues.get(client, True):
+                    del self._queues[client]
+            jobs = self._dispatch()
+        if error is None and inner.cancelled():
+            future.cancel()
+        elif error is None and inner.exception() is not None:
+            error = inner.exception()
+        if not future.cancelled():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(inner.result())
+        self._start(jobs)
+
+
+scheduler = FairScheduler()
+Gauge('apiport_scheduler_running', 'Probe jobs currently running', func=lambda: scheduler.running)
+Gauge('apiport_scheduler_queued', 'Probe jobs waiting in the fair queue', func=lambda: scheduler.queued)
+Gauge('apiport_scheduler_clients', 'Clients with queued or running probe jobs', func=lambda: len(scheduler._queues))
+
+def client_id():
+    return request.headers.get(CLIENT_ID_HEADER) or request.remote_addr or 'unknown'
+
+def rejected_result(ip, port, error):
+    return {'ip': ip, 'port': port, 'open': None, 'status': 'rejected', 'error': str(error)}
+
+
+class ResultCache:
+    """按 (ip, port) 缓存探测结果，开放和关闭分别设置 TTL，超出容量时按 LRU 淘汰。
+
+    超时结果只对超时不长于产生它的那次探测的请求有效，超时更长的请求会重新探测。
+    同一目标以相同超时正在探测时，后来的请求直接等待同一个 Future，只发起一次连接。
+    多次探测判定（submit_quorum）不读写缓存，但同样合并正在进行的相同判定。
+    """
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, open_ttl=CACHE_OPEN_TTL, closed_ttl=CACHE_CLOSED_TTL):
+        self.maxsize = maxsize
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self._data = OrderedDict()  # (ip, port) -> (过期时间, 结果, 探测超时)
+        self._inflight = {}  # (ip, port, timeout) 或 (ip, port, attempts, quorum, timeout) -> Future
+        self._lock = threading.Lock()
+
+    def submit(self, ip, port, timeout, client=None):
+        """返回一个 Future：命中缓存时已完成，否则合并到正在进行或新发起的探测。
+
+        新发起的探测经 scheduler 以 client 的名义排队，排队满时抛出 Rejected。
+        """
+        key = (ip, port)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, result, probe_timeout = entry
+                if expires <= time.monotonic():
+                    del self._data[key]
+                elif result['status'] != TIMEOUT or timeout <= probe_timeout:
+                    self._data.move_to_end(key)
+                    future = Future()
+                    future.set_result(dict(result, cached=True))
+                    CACHE_LOOKUPS.inc('hit')
+                    return future
+            inflight_key = (ip, port, timeout)
+            future = self._inflight.get(inflight_key)
+            if future is not None:
+                CACHE_LOOKUPS.inc('coalesced')
+                return future
+            CACHE_LOOKUPS.inc('miss')
+            future = Future()
+            self._inflight[inflight_key] = future
+        return self._start(inflight_key, future, client, lambda: engine.submit(ip, port, timeout), cacheable=True)
+
+    def submit_quorum(self, ip, port, attempts, quorum, timeout, client=None):
+        """多次探测判定：每次都重新连接，但相同的 (ip, port, attempts, quorum, timeout) 正在判定时合并到同一个 Future"""
+        key = (ip, port, attempts, quorum, timeout)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                CACHE_LOOKUPS.inc('coalesced')
+                return future
+            CACHE_LOOKUPS.inc('miss')
+            future = Future()
+            self._inflight[key] = future
+        return self._start(key, future, client, lambda: engine.submit_quorum(ip, port, attempts, quorum, timeout))
+
+    def _start(self, key, future, client, start_fn, cacheable=False):
+        try:
+            inner = scheduler.submit(client, start_fn)
+        except Rejected as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)  # 已合并进来的请求同样收到拒绝
+            raise
+        inner.add_done_callback(lambda f: self._finish(key, f, future, cacheable))
+        return future
+
+    def _finish(self, key, inner, future, cacheable):
+        result = None
+        if not inner.cancelled() and inner.exception() is None:
+            result = inner.result()
+        with self._lock:
+            self._inflight.pop(key, None)
+            # 多次探测判定和解析失败等错误不缓存
+            if cacheable and result is not None and result['status'] != ERROR:
+                ip, port, timeout = key
+                ttl = self.open_ttl if result['open'] else self.closed_ttl
+                self._data[(ip, port)] = (time.monotonic() + ttl, result, timeout)
+                self._data.move_to_end((ip, port))
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        if inner.cancelled():
+            future.cancel()
+        elif result is None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(result)
+
+
+cache = ResultCache()
+Gauge('apiport_cache_entries', 'Entries in the result cache', func=lambda: len(cache._data))
+Gauge('apiport_cache_in_flight', 'Distinct targets currently being probed through the cache', func=lambda: len(cache._inflight))
+
+def is_port_open(ip, port, timeout=None):
+    return cache.submit(ip, port, clamp_timeout(timeout)).result()['open']
+
+
+class Watch:
+    """一组被持续探测的目标，只在端口状态变化（开放<->关闭）时推送给订阅者
+
+    探测经 scheduler 以创建者 client 的名义排队，和它的 /check_port 请求共用同一份额。
+    """
+
+    def __init__(self, targets, interval, timeout, attempts=1, client=None):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.targets = targets
+        self.interval = interval
+        self.timeout = timeout
+        self.attempts = attempts
+        self.states = {}  # (ip, port) -> 最近一次探测结果
+        self.subscribers = set()  # 每个订阅者一个 queue.Queue
+        self.idle_since = time.monotonic()
+        self.seq = 0  # 事件序号，作为 SSE 的 id
+        self.lock = threading.Lock()
+        self.future = None
+
+    def start(self):
+        self.future = engine.run(self.run())
+
+    def close(self):
+        if self.future is not None:
+            self.future.cancel()
+        with self.lock:
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(None)  # 通知订阅者连接结束
+                except queue.Full:
+                    q.get_nowait()
+                    q.put_nowait(None)
+
+    async def probe(self, slots, ip, port):
+        if self.attempts > 1:
+            start_fn = lambda: engine.submit_quorum(ip, port, self.attempts, 1, self.timeout)
+        else:
+            start_fn = lambda: engine.submit(ip, port, self.timeout)
+        async with slots:
+            return await asyncio.wrap_future(scheduler.submit(self.client, start_fn))
+
+    async def run(self):
+        slots = asyncio.Semaphore(WATCH_CONCURRENCY)
+        try:
+            while True:
+                start = time.monotonic()
+                probes = [self.probe(slots, ip, port) for ip, port in self.targets]
+                results = await asyncio.gather(*probes, return_exceptions=True)
+                for (ip, port), result in zip(self.targets, results):
+                    if isinstance(result, asyncio.CancelledError):
+                        raise result
+                    if isinstance(result, Rejected):  # 排队已满，本轮没有探测，保留上次的状态
+                        continue
+                    if isinstance(result, Exception):  # 单个目标出错只记为错误状态，不影响整个 watch
+                        result = make_result(ip, port, ERROR, 0, str(result))
+                    self.update(result)
+                with self.lock:
+                    idle = not self.subscribers and time.monotonic() - self.idle_since > WATCH_IDLE_TTL
+                if idle:
+                    break
+                await asyncio.sleep(max(0, self.interval - (time.monotonic() - start)))
+        finally:
+            with watches_lock:
+                watches.pop(self.id, None)
+
+    def update(self, result):
+        key = (result['ip'], result['port'])
+        with self.lock:
+            previous = self.states.get(key)
+            self.states[key] = result
+            if previous is None or previous['open'] == result['open']:
+                return
+            self.seq += 1
+            event = {
+                'id': self.seq,
+                'ip': result['ip'],
+                'port': result['port'],
+                'open': result['open'],
+                'status': result['status'],
+                'previous': previous['status'],
+                'time': time.time(),
+            }
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    pass
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'id': self.id,
+                'interval': self.interval,
+                'targets': [
+                    self.states.get((ip, port), {'ip': ip, 'port': port, 'open': None, 'status': None})
+                    for ip, port in self.targets
+                ],
+            }
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+            if not self.subscribers:
+                self.idle_since = time.monotonic()
+
+
+watches = {}  # watch id -> Watch
+watches_lock = threading.Lock()
+Gauge('apiport_watches', 'Registered watches', func=lambda: len(watches))
+
+def format_sse(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def parse_targets(data):
+    """解析批量检测的目标列表，返回 [(ip, port), ...]，格式错误时抛出 ValueError"""
+    default_port = data.get('port')
+    targets = []
+    for item in data.get('targets') or []:
+        if isinstance(item, str):
+            ip, port = item, default_port
+        elif isinstance(item, dict):
+            ip, port = item.get('ip'), item.get('port', default_port)
+        else:
+            raise ValueError(f"Invalid target: {item!r}")
+        if not ip or port is None:
+            raise ValueError(f"Missing IP or port in target: {item!r}")
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid port in target: {item!r}")
+        if not 1 <= port <= MAX_PORT:
+            raise ValueError(f"Port out of range in target: {item!r}")
+        targets.append((ip, port))
+    return targets
+
+@app.before_request
+def start_timer():
+    g.start_time = time.monotonic()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    if endpoint != 'metrics':
+        REQUEST_LATENCY.observe(time.monotonic() - g.start_time, endpoint)
+        REQUESTS.inc(endpoint, str(response.status_code))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/check_port')
 def check_port():
@@ -20,9 +418,167 @@ def check_port():
     port = request.args.get('port', type=int)
     if not ip or port is None:
         return jsonify({'error': 'Missing IP or port parameters'}), 400
-    status = is_port_open(ip, port)
-    return jsonify({'ip': ip, 'port': port, 'open': status})
+    if not 1 <= port <= MAX_PORT:
+        return jsonify({'error': f'port must be between 1 and {MAX_PORT}'}), 400
+    attempts = request.args.get('attempts', 1, type=int)
+    quorum = request.args.get('quorum', 1, type=int)
+    if not 1 <= quorum <= attempts <= MAX_ATTEMPTS:
+        return jsonify({'error': f'attempts and quorum must satisfy 1 <= quorum <= attempts <= {MAX_ATTEMPTS}'}), 400
+    client = client_id()
+    try:
+        timeout = clamp_timeout(request.args.get('timeout', type=float))
+        if attempts > 1:
+            # 多次探测判定不走缓存，每次都重新连接，只合并正在进行的相同判定
+            future = cache.submit_quorum(ip, port, attempts, quorum, timeout, client)
+        else:
+            future = cache.submit(ip, port, timeout, client)
+        return jsonify(future.result())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Rejected as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+
+@app.route('/check_ports', methods=['POST'])
+def check_ports():
+    """批量检测端口，结果按完成顺序以 NDJSON 流式返回
+
+    请求体示例：{"port": 22, "concurrency": 100, "timeout": 2, "targets": ["1.2.3.4", {"ip": "5.6.7.8", "port": 443}]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid data format. JSON object required.'}), 400
+    try:
+        targets = parse_targets(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    targets = list(dict.fromkeys(targets))  # 去重，重复目标只检测一次
+    if not targets:
+        return jsonify({'error': 'Missing targets'}), 400
+    if len(targets) > MAX_BATCH_TARGETS:
+        return jsonify({'error': f'Too many targets, max {MAX_BATCH_TARGETS}'}), 400
+    concurrency = data.get('concurrency', DEFAULT_BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        return jsonify({'error': 'Invalid concurrency'}), 400
+    concurrency = min(concurrency, MAX_BATCH_CONCURRENCY, len(targets))
+    try:
+        timeout = clamp_timeout(data.get('timeout'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid timeout'}), 400
+
+    if scheduler.queued >= scheduler.max_queued:
+        return jsonify({'error': 'Server busy, probe queue is full'}), 429, {'Retry-After': '1'}
+    client = client_id()
+
+    def generate():
+        pending = {}  # Future -> (ip, port)
+        remaining = deque(targets)
+        while remaining or pending:
+            while remaining and len(pending) < concurrency:
+                ip, port = remaining[0]
+                try:
+                    future = cache.submit(ip, port, timeout, client)
+                except Rejected as e:
+                    if pending:
+                        break  # 排队已满，等已提交的探测完成后再重试
+                    remaining.popleft()
+                    yield json.dumps(rejected_result(ip, port, e)) + '\n'
+                    continue
+                except Exception as e:  # 单个目标出错只影响它自己的结果，不中断整个响应流
+                    remaining.popleft()
+                    yield json.dumps(make_result(ip, port, ERROR, 0, str(e))) + '\n'
+                    continue
+                remaining.popleft()
+                pending[future] = (ip, port)
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ip, port = pending.pop(future)
+                try:
+                    result = future.result()
+                except Rejected as e:
+                    result = rejected_result(ip, port, e)
+                except Exception as e:
+                    result = make_result(ip, port, ERROR, 0, str(e))
+                yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/watches', methods=['POST'])
+def create_watch():
+    """注册一组持续探测的目标
+
+    请求体示例：{"port": 22, "interval": 10, "timeout": 1, "attempts": 3, "targets": ["1.2.3.4", "5.6.7.8"]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid data format. JSON object required.'}), 400
+    try:
+        targets = list(dict.fromkeys(parse_targets(data)))
+        timeout = clamp_timeout(data.get('timeout'))
+        interval = max(float(data.get('interval', DEFAULT_WATCH_INTERVAL)), MIN_WATCH_INTERVAL)
+        attempts = int(data.get('attempts', 1))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not targets:
+        return jsonify({'error': 'Missing targets'}), 400
+    if len(targets) > MAX_BATCH_TARGETS:
+        return jsonify({'error': f'Too many targets, max {MAX_BATCH_TARGETS}'}), 400
+    if not 1 <= attempts <= MAX_ATTEMPTS:
+        return jsonify({'error': f'attempts must be between 1 and {MAX_ATTEMPTS}'}), 400
+    client = client_id()
+    watch = Watch(targets, interval, timeout, attempts, client)
+    with watches_lock:
+        if len(watches) >= MAX_WATCHES:
+            return jsonify({'error': 'Too many watches'}), 429
+        if sum(1 for w in watches.values() if w.client == client) >= MAX_CLIENT_WATCHES:
+            return jsonify({'error': f'Too many watches for this client, max {MAX_CLIENT_WATCHES}'}), 429
+        watches[watch.id] = watch
+    watch.start()
+    return jsonify({'id': watch.id, 'targets': len(targets), 'interval': interval}), 201
+
+@app.route('/watches/<watch_id>', methods=['GET'])
+def get_watch(watch_id):
+    watch = watches.get(watch_id)
+    if watch is None:
+        return jsonify({'error': 'Watch not found'}), 404
+    return jsonify(watch.snapshot())
+
+@app.route('/watches/<watch_id>', methods=['DELETE'])
+def delete_watch(watch_id):
+    with watches_lock:
+        watch = watches.pop(watch_id, None)
+    if watch is None:
+        return jsonify({'error': 'Watch not found'}), 404
+    watch.close()
+    return jsonify({'message': 'Watch deleted successfully'})
+
+@app.route('/watches/<watch_id>/events')
+def watch_events(watch_id):
+    """以 Server-Sent Events 推送状态变化：先发送一次当前状态（state），之后只发送变化（transition）"""
+    watch = watches.get(watch_id)
+    if watch is None:
+        return jsonify({'error': 'Watch not found'}), 404
+
+    def generate():
+        q = watch.subscribe()
+        try:
+            yield format_sse('state', watch.snapshot())
+            while True:
+                try:
+                    event = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    break
+                yield format_sse('transition', event, event['id'])
+        finally:
+            watch.unsubscribe(q)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
 
 if __name__ == '__main__':
+    setup_logging(logging.INFO)
     app.run(host='0.0.0.0', port=10080)
-~                                             
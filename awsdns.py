@@ -1,14 +1,18 @@
 import boto3
 import socket
 import time
-import json
 import os
 import logging
 import argparse
-import requests
-from requests.exceptions import ConnectionError, Timeout, RequestException
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logsetup import setup_logging
+from dnsrecords import ZoneSnapshot
+from dnsmutate import MutationExecutor
+from dnsreconcile import reconcile
+from healthcheck import HealthCheckClient, CheckApiUnavailable
+from portprobe import MAX_ATTEMPTS
 from aliyunsdkcore.client import AcsClient
-from aliyunsdkalidns.request.v20150109 import DeleteDomainRecordRequest, AddDomainRecordRequest, DescribeDomainRecordsRequest
 
 
 # 获取环境变量，如果环境变量不存在，则使用后面的默认值
@@ -20,6 +24,13 @@ default_port = os.getenv('PORT', '8080')
 default_alikey = os.getenv('ALIKEY', 'LTAI5tE8E6TT67PQSWRJKij4')
 default_alista = os.getenv('ALISTA', 'aWuq0JtnKXZKYkt2jOvpMQDIKvo5uI')
 default_api = os.getenv('api', '159.75.83.139')
+default_attempts = os.getenv('ATTEMPTS', '3')
+default_log_sample = os.getenv('LOG_SAMPLE', '0')
+default_dns_qps = os.getenv('DNS_QPS', '10')
+default_probe_workers = os.getenv('PROBE_WORKERS', '32')
+default_rotate_workers = os.getenv('ROTATE_WORKERS', '4')
+
+LOAD_WORKERS = 8  # 并发加载的账号、地域数
 
 # 解析命令行参数
 parser = argparse.ArgumentParser(description="脚本用于获取记录ID")
@@ -31,234 +42,241 @@ parser.add_argument("--port", type=int, default=int(default_port), help="端口
 parser.add_argument("--alikey", type=str, default=default_alikey, help="YOUR_ACCESS_KEY_ID")
 parser.add_argument("--alista", type=str, default=default_alista, help="YOUR_ACCESS_SECRET")
 parser.add_argument("--api", type=str, default=default_api, help="你的端口检测api")
+parser.add_argument("--attempts", type=int, default=int(default_attempts), help="服务端探测次数，任意一次成功即认为端口开放")
+parser.add_argument("--log-sample", type=float, default=float(default_log_sample), help="重试日志采样间隔（秒），0 表示不采样")
+parser.add_argument("--dns-qps", type=float, default=float(default_dns_qps), help="解析记录写操作每秒最多请求数")
+parser.add_argument("--dry-run", action="store_true", help="只打印计划的解析记录变更，不实际修改")
+parser.add_argument("--probe-workers", type=int, default=int(default_probe_workers), help="同时检测的实例数")
+parser.add_argument("--rotate-workers", type=int, default=int(default_rotate_workers), help="同时更换 IP 的实例数")
 args = parser.parse_args()
+if not 1 <= args.attempts <= MAX_ATTEMPTS:
+    parser.error(f"--attempts 必须在 1 到 {MAX_ATTEMPTS} 之间")
 
 # 初始化阿里云客户端
 ali_client = AcsClient(args.alikey, args.alista, 'cn-hangzhou')
-
-# 获取与指定子域和记录类型匹配的所有记录
-def get_all_records(domain, subdomain, record_type):
-    request = DescribeDomainRecordsRequest.DescribeDomainRecordsRequest()
-    request.set_DomainName(domain)
-    response = ali_client.do_action_with_exception(request)
-    all_records = json.loads(response)
-    matched_records = [
-        record for record in all_records.get('DomainRecords', {}).get('Record', [])
-        if record.get('RR') == subdomain and record.get('Type') == record_type
-    ]
-    return matched_records
-
-# 确保只有我的IP在解析记录中
-def ensure_only_my_ips(domain, subdomain, record_type, my_ips):
-    records = get_all_records(domain, subdomain, record_type)
-
-    to_delete = [record for record in records if record['Value'] not in my_ips]
-
-    for record in to_delete:
-        try:
-            delete_record(record['RecordId'])
-            logger.info(f"Deleted record {record['RecordId']} with IP {record['Value']}.")
-        except Exception as e:
-            logger.info(f"Error deleting record {record['RecordId']}: {e}")
+mutator = MutationExecutor(ali_client, qps=args.dns_qps, dry_run=args.dry_run)
+# 每轮开始时拉取一次子域名下的全部记录，本轮内的查询和增删都在快照上进行
+zone = ZoneSnapshot(ali_client, args.domain, rr=args.rr)
+# 端口检测API客户端，连接池大小与检测并发数一致
+checker = HealthCheckClient(f"http://{args.api}:10080/check_port", pool_size=args.probe_workers)
 
 # 获取解析记录的ID
 def get_record_id(DomainName, RR, IP):
-    request = DescribeDomainRecordsRequest.DescribeDomainRecordsRequest()
-    request.set_DomainName(DomainName)
-    response = ali_client.do_action_with_exception(request)
-    records = json.loads(response.decode('utf-8'))
-    for record in records['DomainRecords']['Record']:
-        if record['RR'] == RR and record['Value'] == IP:
-            return record['RecordId']
-    return None
+    return zone.find(RR, IP)
 
 # 删除解析记录
 def delete_record(RecordId):
-    request = DeleteDomainRecordRequest.DeleteDomainRecordRequest()
-    request.set_RecordId(RecordId)
-    ali_client.do_action_with_exception(request)
-
-
-# 添加解析记录
-def add_record(DomainName, RR, Type, Value, TTL=600, Line='default'):
-    request = AddDomainRecordRequest.AddDomainRecordRequest()
-    request.set_DomainName(DomainName)
-    request.set_RR(RR)
-    request.set_Type(Type)
-    request.set_Value(Value)
-    request.set_TTL(TTL)
-    request.set_Line(Line)
-    ali_client.do_action_with_exception(request)
+    mutator.delete(RecordId).result()
+    zone.remove(RecordId)
 
 # 日志记录器设置
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+setup_logging(logging.INFO, fmt='%(asctime)s - %(levelname)s - %(message)s', sample_interval=args.log_sample)
 logger = logging.getLogger(__name__)
 
-# 检查是否能连接到指定IP和端口
+# 检查是否能连接到指定IP和端口；检测API不可用或拒绝请求时抛出 CheckApiUnavailable，端口状态未知
 def connect(ip):
-    api_url = f"http://{args.api}:10080/check_port"
-    retries = 10  # 设置重试次数
-    for attempt in range(retries):
-        try:
-            response = requests.get(api_url, params={"ip": ip, "port": args.port}, timeout=10)
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if result.get("open", False):
-                        return True  # 成功返回
-                    else:
-                        logger.error(f"尝试 {attempt + 1}/{retries}：API返回成功，但结果表示失败。")
-                except ValueError:
-                    logger.error(f"尝试 {attempt + 1}/{retries}：无法解析JSON响应。")
-            else:
-                logger.error(f"尝试 {attempt + 1}/{retries}：API返回非200状态码：{response.status_code}")
-        except ConnectionError:
-            logger.error(f"尝试 {attempt + 1}/{retries}：连接错误。")
-        except Timeout:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求超时。")
-        except RequestException as e:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求错误：{e}")
-
-        # 重试日志
-        if attempt < retries - 1:
-            logger.info(f"正在重试... (尝试 {attempt + 2}/{retries})")
-
-    logger.error("所有重试尝试均失败。")
+    result = checker.check(ip, args.port, attempts=args.attempts, quorum=1)
+    if result.get("open", False):
+        return True  # 成功返回
+    logger.error(f"{ip} 端口检测结果为关闭：{result.get('attempts')}")
     return False
 
-# 使用此函数时，您可以调用：
-# connect(ip, f"http://{args.api}:10080/check_port", args.port)
+
+# boto3 客户端按 (账号, 地域, 服务类型) 缓存，重新加载时复用
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_client(access_key, secret_key, region, service):
+    key = (access_key, region, service)
+    with clients_lock:
+        if key not in clients:
+            clients[key] = boto3.client(service, region_name=region, aws_access_key_id=access_key,
+                                        aws_secret_access_key=secret_key)
+        return clients[key]
+
+
+# 加载文件中的一行：同一账号、地域、服务类型的实例用批量接口一次查出
+def load_entry(item):
+    access_key, secret_key, region, service, *names = item
+    client = get_client(access_key, secret_key, region, service)
+    ids = {}
+    # 如果是EC2实例
+    if service == 'ec2':
+        for page in client.get_paginator('describe_instances').paginate(InstanceIds=names):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    ids[instance['InstanceId']] = instance.get('PublicIpAddress')
+    # 如果是Lightsail实例
+    else:
+        wanted = set(names)
+        for page in client.get_paginator('get_instances').paginate():
+            for instance in page['instances']:
+                if instance['name'] in wanted:
+                    ids[instance['name']] = instance.get('publicIpAddress')
+        missing = wanted - ids.keys()
+        if missing:
+            logger.error(f"{region} lightsail instances not found: {', '.join(sorted(missing))}")
+    # 客户端、ID、地域和服务类型，config 用于单独重新加载这一项
+    return {'client': client, "ids": ids, 'region_name': region, 'service': service, 'config': item, 'loaded': True}
 
 
-# 从文件加载AWS服务数据
+# 加载失败的项先占位（没有实例），每轮开始时重试
+def unloaded_entry(item):
+    return {'client': None, "ids": {}, 'region_name': item[2], 'service': item[3], 'config': item, 'loaded': False}
+
+
+# 从文件加载AWS服务数据，各账号、地域并发加载
 def load_aws():
     global aws
-    aws = [] 
+    items = []
     with open(args.file, 'r') as f:
         data = f.read().split('\n')
         for item in data:
             item = item.split(',')
-            if len(item) > 4:
-                # 确定服务类型，是EC2还是Lightsail
-                service = item[3]
-                try:
-                    # 如果是EC2实例
-                    if service == 'ec2':
-                        client = boto3.client('ec2', region_name=item[2], aws_access_key_id=item[0], aws_secret_access_key=item[1])
-                        ids = {}
-                        response = client.describe_instances(InstanceIds=item[4:])
-                        for reservation in response['Reservations']:
-                            for instance in reservation['Instances']:
-                                ids[instance['InstanceId']] = instance['PublicIpAddress']
-                                
-                    # 如果是Lightsail实例
-                    elif service == 'lightsail':
-                        client = boto3.client('lightsail', region_name=item[2], aws_access_key_id=item[0], aws_secret_access_key=item[1])
-                        ids = {}
-                        for instance_id in item[4:]:
-                            response = client.get_instance(instanceName=instance_id)
-                            ids[response['instance']['name']] = response['instance']['publicIpAddress']
-                    else:
-                        continue
-                    
-                    # 添加客户端、ID、地域和服务类型到aws列表中
-                    aws.append({'client': client, "ids": ids, 'region_name': item[2], 'service': service})
-                    
-                except Exception as e:
-                    logger.error(e)
+            # 确定服务类型，是EC2还是Lightsail
+            if len(item) > 4 and item[3] in ('ec2', 'lightsail'):
+                items.append(item)
+    aws = [unloaded_entry(item) for item in items]
+    refresh_entries(aws)
 
-# 主循环
-load_aws()
-while True:
+
+# 重新加载若干项（每项是一个账号在一个地域的一种服务）的实例信息，各项并发；失败的项保留原样
+def refresh_entries(entries):
+    if not entries:
+        return
+    with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(entries))) as executor:
+        futures = [executor.submit(load_entry, a['config']) for a in entries]
+        for a, future in zip(entries, futures):
+            try:
+                a.update(future.result())
+            except Exception as e:
+                logger.error(f"{a['region_name']} {a['service']}, load failed: {e}")
+
+
+# 更换EC2实例的弹性IP
+def rotate_ec2(a, k, v):
+    record_id = get_record_id(args.domain, args.rr, v)
+    if record_id:
+        delete_record(record_id)
+
+    try:
+        response = a['client'].describe_addresses()
+        for address in response['Addresses']:
+            if address.get('InstanceId') == k:
+                a['client'].disassociate_address(AssociationId=address['AssociationId'])
+                a['client'].release_address(AllocationId=address['AllocationId'])
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+
+    try:
+        new_address = a['client'].allocate_address(Domain='vpc')
+        a['client'].associate_address(InstanceId=k, AllocationId=new_address['AllocationId'])
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+
+    response = a['client'].describe_instances(InstanceIds=[k])
+    return response['Reservations'][0]['Instances'][0]['PublicIpAddress']
+
+# 更换Lightsail实例的静态IP
+def rotate_lightsail(a, k, v):
+    try:
+        a['client'].detach_static_ip(staticIpName=k + 'ipv4')
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+
+    try:
+        a['client'].release_static_ip(staticIpName=k + 'ipv4')
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+    try:
+        a['client'].allocate_static_ip(staticIpName=k + 'ipv4')
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+    try:
+        a['client'].attach_static_ip(staticIpName=k + 'ipv4', instanceName=k)
+    except Exception as e:
+        logger.error(f"{k}, {e}")
+
+    response = a['client'].get_instance(instanceName=k)
+    return response['instance']['publicIpAddress']
+
+# 更换实例的IP，返回新的IP地址
+def rotate(a, k, v):
+    logger.info(f"{k}, {v}, attempting to change ip")
+    if a['service'] == 'ec2':
+        return rotate_ec2(a, k, v)
+    return rotate_lightsail(a, k, v)
+
+# 一轮检测：所有实例并发检测，检测失败的实例交给有限大小的线程池更换IP，返回本轮可用的全部IP
+def run_cycle():
     all_ips = []
+    failed = []  # 有实例换 IP 失败的项
+    refresh_entries([a for a in aws if not a['loaded']])  # 之前加载失败的项每轮重试
+    instances = []
     for a in aws:
         for k, v in a['ids'].items():
+            if v:
+                instances.append((a, k, v))
+            else:  # 已停止或换 IP 失败后没有公网 IP 的实例，本轮不检测也不解析
+                logger.warning(f"{k} has no public ip, skip")
+    if not instances:
+        return all_ips
+    with ThreadPoolExecutor(max_workers=min(args.probe_workers, len(instances))) as probes, \
+            ThreadPoolExecutor(max_workers=args.rotate_workers) as rotations:
+        checks = {probes.submit(connect, v): (a, k, v) for a, k, v in instances}
+        changes = {}
+        for future in as_completed(checks):
+            a, k, v = checks[future]
+            try:
+                healthy = future.result()
+            except CheckApiUnavailable as e:
+                # 检测API不可用时端口状态未知，保留现有IP和解析记录，等API恢复后再判断
+                logger.warning(f"{k}, {v}, check api unavailable, skip: {e}", extra={'sample': 'check-api-down'})
+                all_ips.append(v)
+                continue
+            if not healthy:  # 如果连接失败，我们认为需要更换 IP，旧 IP 不再解析
+                changes[rotations.submit(rotate, a, k, v)] = (a, k, v)
+                continue
             all_ips.append(v)  # 收集所有的IP地址
-            current_region = a['region_name']  # 获取当前的region_name
-            print(current_region)
-            if not connect(v):  # 如果连接失败，我们认为需要更换 IP
-                logger.info(f"{k}, {v}, attempting to change ip")
-                
-                if a['service'] == 'ec2':
-                    record_id = get_record_id(args.domain, args.rr, v)
-                    if record_id:
-                        delete_record(record_id)
-
-                    try:
-                        response = a['client'].describe_addresses()
-                        for address in response['Addresses']:
-                            if address.get('InstanceId') == k:
-                                a['client'].disassociate_address(AssociationId=address['AssociationId'])
-                                a['client'].release_address(AllocationId=address['AllocationId'])
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-
-                    try:
-                        new_address = a['client'].allocate_address(Domain='vpc')
-                        a['client'].associate_address(InstanceId=k, AllocationId=new_address['AllocationId'])
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-
-                elif a['service'] == 'lightsail':  # 如果是Lightsail实例
-                    try:
-                        a['client'].detach_static_ip(staticIpName=k + 'ipv4')
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-
-                    try:
-                        a['client'].release_static_ip(staticIpName=k + 'ipv4')
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-                    try:
-                        a['client'].allocate_static_ip(staticIpName=k + 'ipv4')
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-                    try:
-                        a['client'].attach_static_ip(staticIpName=k + 'ipv4', instanceName=k)
-                    except Exception as e:
-                        logger.error(f"{k}, {e}")
-
-                # 更新新的IP地址
-                try:
-                    if a['service'] == 'ec2':
-                        response = a['client'].describe_instances(InstanceIds=[k])
-                        new_ip = response['Reservations'][0]['Instances'][0]['PublicIpAddress']
-                    elif a['service'] == 'lightsail':
-                        response = a['client'].get_instance(instanceName=k)
-                        new_ip = response['instance']['publicIpAddress']
-
-                    all_ips.append(new_ip)
-                    all_ips.remove(v)
-                    if get_record_id(args.domain, args.rr, new_ip) is None:
-                        line = 'default'
-                        if a.get('region_name') == 'ap-northeast-1':
-                            line = 'unicom'
-                        elif a.get('region_name') == 'ap-southeast-1':
-                            line = 'telecom'
-                        add_record(args.domain, args.rr, 'A', new_ip, TTL=args.ttl)
-                    logger.info(f"{k}, {v} -> {new_ip}, ip change successful")
-                    a["ids"][k] = new_ip
-                except Exception as e:
-                    logger.error(f"{k}, {e}, ip change failed")
-                    load_aws()
-
-            else:  # 如果连接成功，检查是否已解析
-                try:
-                    is_resolved = get_record_id(args.domain, args.rr, v)
-                    if not is_resolved:
-                        logger.info(f"{k} {v} has not been resolved in DNS.")
-                        if get_record_id(args.domain, args.rr, v) is None:
-                            line = 'default'
-                            if a.get('region_name') == 'ap-northeast-1':
-                                line = 'unicom'
-                            elif a.get('region_name') == 'ap-southeast-1':
-                                line = 'telecom'
-                            add_record(args.domain, args.rr, 'A', v, TTL=args.ttl)
-                    else:
-                        logger.info(f"{k} {v} is already resolved in DNS.")
-                except Exception as e:
-                    logger.info(k, e, "error checking DNS resolution")
-                logger.info(f"{k}, {v}, connect success")
+            # 检查是否已解析，缺少的记录在本轮结束时统一添加
+            if get_record_id(args.domain, args.rr, v) is None:
+                logger.info(f"{k} {v} has not been resolved in DNS.")
+            else:
+                logger.info(f"{k} {v} is already resolved in DNS.")
+            logger.info(f"{k}, {v}, connect success")
+
+        for future in as_completed(changes):
+            a, k, v = changes[future]
+            try:
+                new_ip = future.result()
+            except Exception as e:
+                logger.error(f"{k}, {e}, ip change failed")
+                if not any(entry is a for entry in failed):
+                    failed.append(a)
+                continue
+            all_ips.append(new_ip)
+            logger.info(f"{k}, {v} -> {new_ip}, ip change successful")
+            a["ids"][k] = new_ip
+    refresh_entries(failed)  # 有实例换 IP 失败时，本轮结束后只重新加载它所在的那几项
+    return all_ips
+
+# 主循环
+load_aws()
+while True:
+    try:
+        zone.refresh()
+    except Exception as e:
+        logger.error(f"拉取解析记录失败，跳过本轮：{e}")
+        time.sleep(60)
+        continue
+    all_ips = run_cycle()
     logger.info(all_ips)
-    ensure_only_my_ips(args.domain, args.rr, 'A', all_ips)
+    # 按本轮的全部可用 IP 调和解析记录：一次性添加缺少的、删除多余的
+    try:
+        added, deleted, failed = reconcile(zone, mutator, {(args.rr, 'A', ip, 'default') for ip in all_ips},
+                                           scope=[(args.rr, 'A')], ttl=args.ttl)
+        logger.info(f"DNS reconciled: {added} added, {deleted} deleted, {failed} failed")
+    except Exception as e:
+        logger.error(f"DNS reconcile failed: {e}")
     time.sleep(60)
@@ -1,18 +1,23 @@
 import socket
 import time
 import uuid
-import json
 import os
 import logging
 import argparse
-import requests
-from requests.exceptions import ConnectionError, Timeout, RequestException
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from logsetup import setup_logging
+from dnsrecords import ZoneSnapshot
+from dnsmutate import MutationExecutor
+from dnsreconcile import reconcile
+from healthcheck import HealthCheckClient, CheckApiUnavailable
+from portprobe import MAX_ATTEMPTS
+from azure.core.exceptions import ResourceNotFoundError
 from azure.identity import ClientSecretCredential
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.network import NetworkManagementClient
 from aliyunsdkcore.client import AcsClient
-from aliyunsdkalidns.request.v20150109 import DeleteDomainRecordRequest, AddDomainRecordRequest, \
-    DescribeDomainRecordsRequest
 
 # 获取环境变量，如果环境变量不存在，则使用后面的默认值
 default_domain = os.getenv('DOMAIN', 'default_domain.com')
@@ -23,6 +28,14 @@ default_port = os.getenv('PORT', '8080')
 default_alikey = os.getenv('ALIKEY', 'LTAI5tE8E6TT67PQSWRJKij4')
 default_alista = os.getenv('ALISTA', 'aWuq0JtnKXZKYkt2jOvpMQDIKvo5uI')
 default_api = os.getenv('api', '159.75.83.139')
+default_attempts = os.getenv('ATTEMPTS', '3')
+default_log_sample = os.getenv('LOG_SAMPLE', '0')
+default_dns_qps = os.getenv('DNS_QPS', '10')
+default_probe_workers = os.getenv('PROBE_WORKERS', '32')
+default_rotate_workers = os.getenv('ROTATE_WORKERS', '32')
+
+ROTATION_POLL_INTERVAL = 2  # 换IP时检查 LRO 和资源状态的间隔（秒）
+READY_TIMEOUT = 300  # 等待旧公网IP删除完成、新IP分配完成的最长时间（秒）
 
 
 # 解析命令行参数
@@ -35,106 +48,89 @@ parser.add_argument("--port", type=int, default=int(default_port), help="端口
 parser.add_argument("--alikey", type=str, default=default_alikey, help="YOUR_ACCESS_KEY_ID")
 parser.add_argument("--alista", type=str, default=default_alista, help="YOUR_ACCESS_SECRET")
 parser.add_argument("--api", type=str, default=default_api, help="你的端口检测api")
+parser.add_argument("--attempts", type=int, default=int(default_attempts), help="服务端探测次数，任意一次成功即认为端口开放")
+parser.add_argument("--log-sample", type=float, default=float(default_log_sample), help="重试日志采样间隔（秒），0 表示不采样")
+parser.add_argument("--dns-qps", type=float, default=float(default_dns_qps), help="解析记录写操作每秒最多请求数")
+parser.add_argument("--dry-run", action="store_true", help="只打印计划的解析记录变更，不实际修改")
+parser.add_argument("--probe-workers", type=int, default=int(default_probe_workers), help="同时检测的VM数")
+parser.add_argument("--rotate-workers", type=int, default=int(default_rotate_workers), help="同时更换 IP 的VM数（LRO 由一个后台线程统一轮询）")
 args = parser.parse_args()
+if not 1 <= args.attempts <= MAX_ATTEMPTS:
+    parser.error(f"--attempts 必须在 1 到 {MAX_ATTEMPTS} 之间")
 
 
 # 初始化阿里云客户端
 ali_client = AcsClient(args.alikey, args.alista, 'cn-hangzhou')
+mutator = MutationExecutor(ali_client, qps=args.dns_qps, dry_run=args.dry_run)
+# 每轮开始时拉取一次子域名下的全部记录，本轮内的查询和增删都在快照上进行
+zone = ZoneSnapshot(ali_client, args.domain, rr=args.rr)
+# 端口检测API客户端，连接池大小与检测并发数一致
+checker = HealthCheckClient(f"http://{args.api}:10080/check_port", pool_size=args.probe_workers)
 
 
-# 获取与指定子域和记录类型匹配的所有记录
-def get_all_records(domain, subdomain, record_type):
-    request = DescribeDomainRecordsRequest.DescribeDomainRecordsRequest()
-    request.set_DomainName(domain)
-    response = ali_client.do_action_with_exception(request)
-    all_records = json.loads(response)
-    matched_records = [
-        record for record in all_records.get('DomainRecords', {}).get('Record', [])
-        if record.get('RR') == subdomain and record.get('Type') == record_type
-    ]
-    return matched_records
+# 获取解析记录的ID
+def get_record_id(DomainName, RR, IP):
+    return zone.find(RR, IP)
 
-# 确保只有我的IP在解析记录中
-def ensure_only_my_ips(domain, subdomain, record_type, my_ips):
-    records = get_all_records(domain, subdomain, record_type)
 
-    to_delete = [record for record in records if record['Value'] not in my_ips]
+# 删除解析记录：只提交给限速执行器，不等待完成；删除成功后从快照中移除
+# 本轮结束调和前要等这些删除完成，否则快照里仍有这些记录，调和时会再删一次
+pending_deletes = set()
+pending_deletes_lock = threading.Lock()
 
-    for record in to_delete:
-        try:
-            delete_record(record['RecordId'])
-            logger.info(f"Deleted record {record['RecordId']} with IP {record['Value']}.")
-        except Exception as e:
-            logger.info(f"Error deleting record {record['RecordId']}: {e}")
 
+def delete_record(RecordId):
+    done = Future()  # 快照更新之后才完成
 
-# 获取解析记录的ID
-def get_record_id(DomainName, RR, IP):
-    request = DescribeDomainRecordsRequest.DescribeDomainRecordsRequest()
-    request.set_DomainName(DomainName)
-    response = ali_client.do_action_with_exception(request)
-    records = json.loads(response.decode('utf-8'))
-    for record in records['DomainRecords']['Record']:
-        if record['RR'] == RR and record['Value'] == IP:
-            return record['RecordId']
-    return None
+    def on_done(future):
+        if future.exception() is None:
+            zone.remove(RecordId)
+        else:
+            print(f"Error deleting record {RecordId}: {future.exception()}")
+        with pending_deletes_lock:
+            pending_deletes.discard(done)
+        done.set_result(None)
 
+    with pending_deletes_lock:
+        pending_deletes.add(done)
+    mutator.delete(RecordId).add_done_callback(on_done)
+    return done
+
+
+def wait_pending_deletes():
+    with pending_deletes_lock:
+        futures = list(pending_deletes)
+    wait(futures)
 
-# 删除解析记录
-def delete_record(RecordId):
-    request = DeleteDomainRecordRequest.DeleteDomainRecordRequest()
-    request.set_RecordId(RecordId)
-    ali_client.do_action_with_exception(request)
-
-
-# 添加解析记录
-def add_record(DomainName, RR, Type, Value, TTL=600, Line='default'):
-    request = AddDomainRecordRequest.AddDomainRecordRequest()
-    request.set_DomainName(DomainName)
-    request.set_RR(RR)
-    request.set_Type(Type)
-    request.set_Value(Value)
-    request.set_TTL(TTL)
-    request.set_Line(Line)
-    ali_client.do_action_with_exception(request)
 
 # 日志记录器设置
-logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+setup_logging(logging.WARNING, sample_interval=args.log_sample)
 logger = logging.getLogger(__name__)
 
-# 检查是否能连接到指定IP和端口
+# 检查是否能连接到指定IP和端口；检测API不可用或拒绝请求时抛出 CheckApiUnavailable，端口状态未知
 def connect(ip):
-    api_url = f"http://{args.api}:10080/check_port"
-    retries = 10  # 设置重试次数
-    for attempt in range(retries):
-        try:
-            response = requests.get(api_url, params={"ip": ip, "port": args.port}, timeout=10)
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if result.get("open", False):
-                        return True  # 成功返回
-                    else:
-                        logger.error(f"尝试 {attempt + 1}/{retries}：API返回成功，但结果表示失败。")
-                except ValueError:
-                    logger.error(f"尝试 {attempt + 1}/{retries}：无法解析JSON响应。")
-            else:
-                logger.error(f"尝试 {attempt + 1}/{retries}：API返回非200状态码：{response.status_code}")
-        except ConnectionError:
-            logger.error(f"尝试 {attempt + 1}/{retries}：连接错误。")
-        except Timeout:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求超时。")
-        except RequestException as e:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求错误：{e}")
-
-        # 重试日志
-        if attempt < retries - 1:
-            logger.info(f"正在重试... (尝试 {attempt + 2}/{retries})")
-
-    logger.error("所有重试尝试均失败。")
+    result = checker.check(ip, args.port, attempts=args.attempts, quorum=1)
+    if result.get("open", False):
+        return True  # 成功返回
+    logger.error(f"{ip} 端口检测结果为关闭：{result.get('attempts')}")
     return False
 
 
+# 凭据和管理客户端按 (租户, 应用, 订阅) 缓存，重新加载配置时复用
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_clients(tenant_id, client_id, client_secret, subscription_id):
+    key = (tenant_id, client_id, client_secret, subscription_id)
+    with clients_lock:
+        if key not in clients:
+            credential = ClientSecretCredential(tenant_id, client_id, client_secret)
+            clients[key] = (ComputeManagementClient(credential, subscription_id),
+                            NetworkManagementClient(credential, subscription_id))
+        return clients[key]
+
+
 def load_azure():
     global azure_vms
     azure_vms = []
@@ -145,154 +141,355 @@ def load_azure():
             if len(config) > 6:
                 try:
                     tenant_id, client_id, client_secret, subscription_id, resource_group, region, *vm_names = config
-                    credential = ClientSecretCredential(tenant_id, client_id, client_secret)
-                    compute_client = ComputeManagementClient(credential, subscription_id)
-                    network_client = NetworkManagementClient(credential, subscription_id)
+                    compute_client, network_client = get_clients(tenant_id, client_id, client_secret, subscription_id)
                     vms = {vm_name: None for vm_name in vm_names}
                     azure_vms.append({
                         'compute_client': compute_client,
                         'network_client': network_client,
+                        'subscription_id': subscription_id,
                         'resource_group': resource_group,
                         'region': region,
-                        'vms': vms
+                        'vms': vms,
+                        'snapshot': None
                     })
                 except Exception as e:
                     print(e)
 
 
-load_azure()
+def resource_group_of(resource_id):
+    # /subscriptions/<订阅>/resourceGroups/<资源组>/providers/...
+    return resource_id.split('/')[4]
 
 
-while True:
-    all_ips = []
+class ResourceGroupSnapshot:
+    """一个资源组内的VM、网卡和公网IP，每轮用 list 接口各拉取一次；VM按名称、网卡和公网IP按资源ID索引（小写）"""
+
+    def __init__(self, azure):
+        resource_group = azure['resource_group']
+        self.vms = {vm.name.lower(): vm for vm in azure['compute_client'].virtual_machines.list(resource_group)}
+        self.nics = {nic.id.lower(): nic for nic in azure['network_client'].network_interfaces.list(resource_group)}
+        self.public_ips = {public_ip.id.lower(): public_ip
+                           for public_ip in azure['network_client'].public_ip_addresses.list(resource_group)}
+
+
+# 以下从快照中取VM、网卡和公网IP，快照中没有（或还没有快照）时单独查询
+def get_vm(azure, vm_name):
+    vm = azure['snapshot'].vms.get(vm_name.lower()) if azure['snapshot'] else None
+    return vm or azure['compute_client'].virtual_machines.get(azure['resource_group'], vm_name)
+
+
+def get_nic(azure, nic_id):
+    nic = azure['snapshot'].nics.get(nic_id.lower()) if azure['snapshot'] else None
+    return nic or azure['network_client'].network_interfaces.get(resource_group_of(nic_id), nic_id.split('/')[-1])
+
+
+def get_public_ip(azure, public_ip_id):
+    public_ip = azure['snapshot'].public_ips.get(public_ip_id.lower()) if azure['snapshot'] else None
+    return public_ip or azure['network_client'].public_ip_addresses.get(resource_group_of(public_ip_id),
+                                                                        public_ip_id.split('/')[-1])
+
+
+# 每轮开始时为每个 (订阅, 资源组) 拉取一次快照，各资源组并发；拉取失败时本轮对该资源组逐个查询
+def refresh_snapshots():
+    groups = {}
     for azure in azure_vms:
-        for vm_name in azure['vms']:
+        groups.setdefault((azure['subscription_id'], azure['resource_group'].lower()), []).append(azure)
+    if not groups:
+        return
+    with ThreadPoolExecutor(max_workers=min(args.probe_workers, len(groups))) as executor:
+        futures = {executor.submit(ResourceGroupSnapshot, entries[0]): key for key, entries in groups.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                snapshot = future.result()
+            except Exception as e:
+                print(f"Error listing resource group {key[1]}: {e}")
+                snapshot = None
+            for azure in groups[key]:
+                azure['snapshot'] = snapshot
+
+
+# 随机生成公网IP的域名标签
+def new_label():
+    return "a" + str(uuid.uuid4()).split('-')[0][:15]
+
+
+# 获取VM的网卡和公网IP（没有公网IP或域名标签时先补上），并检测端口，返回VM的当前状态
+def inspect(azure, vm_name):
+    vm = get_vm(azure, vm_name)
+    nic_id = vm.network_profile.network_interfaces[0].id
+    nic_name = nic_id.split('/')[-1]
+    nic = get_nic(azure, nic_id)
+
+    public_ip_address_object = nic.ip_configurations[0].public_ip_address
+
+    if not public_ip_address_object:
+        print(f"VM {vm_name} does not have a public IP address. Creating one...")
+
+        # Create a new public IP
+        public_ip_name = f"{vm_name}-ip"  # Assuming VM names are unique
+        public_ip_params = {
+            'location': azure['region'],
+            'public_ip_allocation_method': 'Static'
+        }
+        new_public_ip = azure['network_client'].public_ip_addresses.begin_create_or_update(
+            azure['resource_group'],
+            public_ip_name,
+            public_ip_params
+        ).result()
+
+        # Associate the new public IP to the network interface
+        nic.ip_configurations[0].public_ip_address = new_public_ip
+        azure['network_client'].network_interfaces.begin_create_or_update(azure['resource_group'], nic_name,
+                                                                          nic).result()
+
+        public_ip = new_public_ip
+        public_ip_address = new_public_ip.ip_address
+    else:
+        public_ip_id = public_ip_address_object.id
+        public_ip_name = public_ip_id.split('/')[-1]
+        public_ip = get_public_ip(azure, public_ip_id)
+        public_ip_address = public_ip.ip_address
+    fqdn = public_ip.dns_settings.fqdn if public_ip.dns_settings else None
+
+    if not fqdn:
+        public_ip.dns_settings = {
+            'domain_name_label': new_label()
+        }
+        public_ip = azure['network_client'].public_ip_addresses.begin_create_or_update(
+            azure['resource_group'], public_ip_name, public_ip).result()
+        fqdn = public_ip.dns_settings.fqdn
+
+    try:
+        healthy = connect(public_ip_address)
+    except CheckApiUnavailable as e:
+        # 检测API不可用时端口状态未知，保留现有IP和解析记录，等API恢复后再判断
+        print(f"{vm_name} {public_ip_address} check api unavailable, skip: {e}")
+        healthy = None
+    return {'nic': nic, 'nic_name': nic_name, 'public_ip': public_ip, 'public_ip_name': public_ip_name,
+            'address': public_ip_address, 'fqdn': fqdn, 'healthy': healthy}
+
+
+class RotationEngine:
+    """同时推进多个VM的换IP流程：解绑 -> 删除 -> 等待删除完成 -> 创建 -> 等待IP分配 -> 绑定 ->（补域名标签）
+
+    每一步发起 LRO 后不阻塞等待，后台线程轮询所有VM的 poller.done() 和资源状态，哪个VM的操作完成就推进哪个，
+    同时进行中的VM不超过 max_active 个。submit 返回 Future，结果为新的IP地址。
+    """
+
+    def __init__(self, max_active):
+        self.max_active = max_active
+        self._pending = deque()
+        self._active = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, azure, vm_name, state):
+        job = dict(state, azure=azure, vm_name=vm_name, step='start', poller=None, check_at=0, deadline=None,
+                   future=Future())
+        with self._lock:
+            self._pending.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='az-rotate', daemon=True)
+                self._thread.start()
+        return job['future']
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending and len(self._active) < self.max_active:
+                    self._active.append(self._pending.popleft())
+                if not self._active:
+                    self._thread = None
+                    return
+                jobs = list(self._active)
+            finished = []
+            for job in jobs:
+                try:
+                    if self._advance(job):
+                        finished.append(job)
+                        job['future'].set_result(job['public_ip'].ip_address)
+                except Exception as e:
+                    finished.append(job)
+                    job['future'].set_exception(e)
+            with self._lock:
+                for job in finished:
+                    self._active.remove(job)
+            if not finished:
+                time.sleep(ROTATION_POLL_INTERVAL)
+
+    def _advance(self, job):
+        """尽可能往下推进一个VM的流程，全部完成时返回 True"""
+        while job['step'] != 'done':
+            poller = job['poller']
+            if poller is not None and not poller.done():
+                return False
+            if time.monotonic() < job['check_at']:
+                return False
+            job['poller'] = None
+            getattr(self, '_' + job['step'])(job, poller.result() if poller is not None else None)
+        return True
+
+    def _begin(self, job, step, poller):
+        job['step'], job['poller'] = step, poller
+
+    def _wait(self, job, what):
+        """资源还没就绪：超时则失败，否则过一个轮询间隔再检查"""
+        if time.monotonic() > job['deadline']:
+            raise TimeoutError(f"{job['vm_name']} {what}超时")
+        job['check_at'] = time.monotonic() + ROTATION_POLL_INTERVAL
+
+    def _start(self, job, _):
+        azure, nic = job['azure'], job['nic']
+        print(job['vm_name'], job['address'], 'change ip')
+        # 删除阿里云解析记录
+        record_id = get_record_id(args.domain, args.rr, job['address'])
+        if record_id:
+            delete_record(record_id)  # 不等待删除完成，避免限流退避卡住其它VM的流程
+        public_ip = job['public_ip']
+        job['label'] = (public_ip.dns_settings.domain_name_label if public_ip.dns_settings else None) or new_label()
+
+        # Step 1: Disassociate the public IP from the network interface
+        nic.ip_configurations[0].public_ip_address = None
+        self._begin(job, 'disassociate', azure['network_client'].network_interfaces.begin_create_or_update(
+            azure['resource_group'], job['nic_name'], nic))
+
+    def _disassociate(self, job, _):
+        # Step 2: Delete the public IP
+        azure = job['azure']
+        self._begin(job, 'delete', azure['network_client'].public_ip_addresses.begin_delete(
+            azure['resource_group'], job['public_ip_name']))
+
+    def _delete(self, job, _):
+        job['step'], job['deadline'] = 'deleted', time.monotonic() + READY_TIMEOUT
+
+    def _deleted(self, job, _):
+        # 等到公网IP确实查不到了再用同名重建
+        azure = job['azure']
+        try:
+            azure['network_client'].public_ip_addresses.get(azure['resource_group'], job['public_ip_name'])
+        except ResourceNotFoundError:
+            pass
+        else:
+            self._wait(job, '等待公网IP删除')
+            return
+        # Step 3: Create a new public IP
+        new_public_ip_params = {
+            'location': azure['region'],
+            'public_ip_allocation_method': 'Static',
+            'dns_settings': {
+                'domain_name_label': job['label']
+            }
+        }
+        self._begin(job, 'create', azure['network_client'].public_ip_addresses.begin_create_or_update(
+            azure['resource_group'], job['public_ip_name'], new_public_ip_params))
+
+    def _create(self, job, public_ip):
+        job['public_ip'], job['step'], job['deadline'] = public_ip, 'allocated', time.monotonic() + READY_TIMEOUT
+
+    def _allocated(self, job, _):
+        # 等到新IP分配完成再绑定
+        azure, public_ip = job['azure'], job['public_ip']
+        if public_ip is None:
+            public_ip = job['public_ip'] = azure['network_client'].public_ip_addresses.get(
+                azure['resource_group'], job['public_ip_name'])
+        if not public_ip.ip_address or public_ip.provisioning_state != 'Succeeded':
+            job['public_ip'] = None
+            self._wait(job, '等待新IP分配')
+            return
+        # Step 4: Reassociate the new public IP to the network interface
+        job['nic'].ip_configurations[0].public_ip_address = public_ip
+        self._begin(job, 'associate', azure['network_client'].network_interfaces.begin_create_or_update(
+            azure['resource_group'], job['nic_name'], job['nic']))
+
+    def _associate(self, job, _):
+        azure, public_ip = job['azure'], job['public_ip']
+        if public_ip.dns_settings and public_ip.dns_settings.fqdn:
+            self._finish(job)
+            return
+        public_ip.dns_settings = {
+            'domain_name_label': new_label()
+        }
+        self._begin(job, 'label', azure['network_client'].public_ip_addresses.begin_create_or_update(
+            azure['resource_group'], job['public_ip_name'], public_ip))
+
+    def _label(self, job, public_ip):
+        job['public_ip'] = public_ip
+        self._finish(job)
+
+    def _finish(self, job):
+        public_ip = job['public_ip']
+        fqdn = public_ip.dns_settings.fqdn if public_ip.dns_settings else None
+        print(f"New IP Address for {job['vm_name']}: {public_ip.ip_address}, FQDN: {fqdn}")
+        job['step'] = 'done'
+
+
+engine = RotationEngine(args.rotate_workers)
+
+
+# 一轮检测：先刷新各资源组的快照，所有VM并发检测，检测失败的VM交给换IP引擎并行处理，返回本轮可用的全部IP
+def run_cycle():
+    all_ips = []
+    refresh_snapshots()
+    vms = [(azure, vm_name) for azure in azure_vms for vm_name in azure['vms']]
+    if not vms:
+        return all_ips
+    with ThreadPoolExecutor(max_workers=min(args.probe_workers, len(vms))) as probes:
+        checks = {probes.submit(inspect, azure, vm_name): (azure, vm_name) for azure, vm_name in vms}
+        changes = {}
+        for future in as_completed(checks):
+            azure, vm_name = checks[future]
             try:
-                vm = azure['compute_client'].virtual_machines.get(azure['resource_group'], vm_name)
-                nic_name = vm.network_profile.network_interfaces[0].id.split('/')[-1]
-                nic = azure['network_client'].network_interfaces.get(azure['resource_group'], nic_name)
-
-                public_ip_address_object = nic.ip_configurations[0].public_ip_address
-
-                if not public_ip_address_object:
-                    print(f"VM {vm_name} does not have a public IP address. Creating one...")
-
-                    # Create a new public IP
-                    public_ip_name = f"{vm_name}-ip"  # Assuming VM names are unique
-                    public_ip_params = {
-                        'location': azure['region'],
-                        'public_ip_allocation_method': 'Static'
-                    }
-                    new_public_ip = azure['network_client'].public_ip_addresses.begin_create_or_update(
-                        azure['resource_group'],
-                        public_ip_name,
-                        public_ip_params
-                    ).result()
-
-                    # Associate the new public IP to the network interface
-                    nic.ip_configurations[0].public_ip_address = new_public_ip
-                    azure['network_client'].network_interfaces.begin_create_or_update(azure['resource_group'], nic_name,
-                                                                                      nic).result()
-
-                    public_ip = new_public_ip
-                    public_ip_address = new_public_ip.ip_address
-                else:
-                    public_ip_id = public_ip_address_object.id
-                    public_ip_name = public_ip_id.split('/')[-1]
-                    public_ip = azure['network_client'].public_ip_addresses.get(azure['resource_group'], public_ip_name)
-                    public_ip_address = public_ip.ip_address
-                if public_ip_address:
-                    all_ips.append(public_ip_address)  # 收集所有的IP地址
-                fqdn = public_ip.dns_settings.fqdn if public_ip.dns_settings else None
-
-                if not fqdn:
-                    random_label = "a" + str(uuid.uuid4()).split('-')[0][:15]
-                    public_ip.dns_settings = {
-                        'domain_name_label': random_label
-                    }
-                    public_ip = azure['network_client'].public_ip_addresses.begin_create_or_update(
-                        azure['resource_group'], public_ip_name, public_ip).result()
-                    fqdn = public_ip.dns_settings.fqdn
-
-                if not connect(public_ip_address):
-                    print(vm_name, public_ip_address, 'change ip')
-                    # 获取阿里云解析记录的RecordId
-                    record_id = get_record_id(args.domain, args.rr, public_ip_address)
-                     # 删除阿里云解析记录
-                    if record_id:
-                        delete_record(record_id)
-                    existing_domain_name_label = public_ip.dns_settings.domain_name_label if public_ip.dns_settings else None
-                    if not existing_domain_name_label:
-                        existing_domain_name_label = "a" + str(uuid.uuid4()).split('-')[0][:15]
-
-                    # Step 1: Disassociate the public IP from the network interface
-                    nic.ip_configurations[0].public_ip_address = None
-                    azure['network_client'].network_interfaces.begin_create_or_update(azure['resource_group'], nic_name,
-                                                                                      nic).result()
-
-                    # Step 2: Delete the public IP
-                    azure['network_client'].public_ip_addresses.begin_delete(azure['resource_group'],
-                                                                             public_ip_name).result()
-                    time.sleep(10)
-
-                    # Step 3: Create a new public IP
-                    new_public_ip_params = {
-                        'location': azure['region'],
-                        'public_ip_allocation_method': 'Static',
-                        'dns_settings': {
-                            'domain_name_label': existing_domain_name_label
-                        }
-                    }
-                    azure['network_client'].public_ip_addresses.begin_create_or_update(azure['resource_group'],
-                                                                                       public_ip_name,
-                                                                                       new_public_ip_params).result()
-
-                    # Step 4: Reassociate the new public IP to the network interface
-                    updated_public_ip = azure['network_client'].public_ip_addresses.get(azure['resource_group'],
-                                                                                        public_ip_name)
-                    nic.ip_configurations[0].public_ip_address = updated_public_ip
-                    azure['network_client'].network_interfaces.begin_create_or_update(azure['resource_group'], nic_name,
-                                                                                      nic).result()
-                    if not updated_public_ip.dns_settings or not updated_public_ip.dns_settings.fqdn:
-                        random_label = "a" + str(uuid.uuid4()).split('-')[0][:15]
-                        updated_public_ip.dns_settings = {
-                            'domain_name_label': random_label
-                        }
-                        updated_public_ip = azure['network_client'].public_ip_addresses.begin_create_or_update(
-                            azure['resource_group'],
-                            public_ip_name,updated_public_ip).result()
-
-                    updated_ip_address = updated_public_ip.ip_address
-                    all_ips.append(updated_ip_address)
-                    all_ips.remove(public_ip_address)
-                    # 如果DNS记录中不存在这个IP，就添加新的解析记录
-                    if get_record_id(args.domain, args.rr, updated_ip_address) is None:
-                        line = 'default'  # 默认线路
-                        add_record(args.domain, args.rr, 'A', updated_ip_address, TTL=args.ttl)
-                    fqdn = updated_public_ip.dns_settings.fqdn if updated_public_ip.dns_settings else None
-                    print(f"New IP Address for {vm_name}: {updated_ip_address}, FQDN: {fqdn}")
-
-                else:
-                    try:
-                        is_resolved = get_record_id(args.domain, args.rr, public_ip_address)
-                        if not is_resolved:  # 如果IP没有解析
-                            print(f"{vm_name} {public_ip_address} has not been resolved in DNS.")
-                            try:
-                                # 如果DNS记录中不存在这个IP，就添加新的解析记录
-                                #   .  default：默认 telecom：中国电信 unicom：中国联通 mobile：中国移动
-                                if get_record_id(args.domain, args.rr, public_ip_address) is None:
-                                    line = 'default'  # 默认线路
-                                    add_record(args.domain, args.rr, 'A', public_ip_address, TTL=args.ttl)
-                            except Exception as e:
-                                print(vm_name, e, "adding DNS record failed")
-                        else:
-                            print(f"{vm_name} {public_ip_address} is already resolved in DNS.")
-                    except Exception as e:
-                        print(vm_name, e, "error checking DNS resolution")
-                    print(vm_name, public_ip_address, 'connect success, FQDN：' + fqdn)
+                state = future.result()
             except Exception as e:
                 print(f"Error with VM {vm_name}: {e}")
-                load_azure()
+                continue
+            public_ip_address = state['address']
+            if state['healthy'] is False:  # 换 IP 失败时也不再解析到旧 IP
+                changes[engine.submit(azure, vm_name, state)] = vm_name
+                continue
+            if public_ip_address:
+                all_ips.append(public_ip_address)  # 收集所有的IP地址
+            if state['healthy'] is None:
+                continue
+            # 缺少的解析记录在本轮结束时统一添加
+            if get_record_id(args.domain, args.rr, public_ip_address) is None:  # 如果IP没有解析
+                print(f"{vm_name} {public_ip_address} has not been resolved in DNS.")
+            else:
+                print(f"{vm_name} {public_ip_address} is already resolved in DNS.")
+            print(vm_name, public_ip_address, f"connect success, FQDN：{state['fqdn']}")
+
+        for future in as_completed(changes):
+            vm_name = changes[future]
+            try:
+                updated_ip_address = future.result()
+            except Exception as e:
+                print(f"Error with VM {vm_name}: {e}")
+                continue
+            if updated_ip_address:
+                all_ips.append(updated_ip_address)
+    return all_ips
+
+
+load_azure()
+
+
+while True:
+    try:
+        zone.refresh()
+    except Exception as e:
+        print(f"拉取解析记录失败，跳过本轮：{e}")
+        time.sleep(60)
+        continue
+    all_ips = run_cycle()
     print(all_ips)
-    ensure_only_my_ips(args.domain, args.rr, 'A', all_ips)
+    wait_pending_deletes()  # 换 IP 时提交的删除完成后再调和，避免重复删除同一条记录
+    # 按本轮的全部可用 IP 调和解析记录：一次性添加缺少的、删除多余的
+    #   线路 default：默认 telecom：中国电信 unicom：中国联通 mobile：中国移动
+    try:
+        added, deleted, failed = reconcile(zone, mutator, {(args.rr, 'A', ip, 'default') for ip in all_ips},
+                                           scope=[(args.rr, 'A')], ttl=args.ttl)
+        print(f"DNS reconciled: {added} added, {deleted} deleted, {failed} failed")
+    except Exception as e:
+        print(f"DNS reconcile failed: {e}")
     time.sleep(60)
@@ -0,0 +1,188 @@
+"""端口检测服务的压测脚本
+
+在本机启动一批监听端口（开放）、一批已关闭端口（拒绝连接），再加上不可路由地址（黑洞，
+连接只能超时），按给定比例和并发驱动 /check_port 或 /check_ports，输出吞吐量和 p50/p95/p99 延迟。
+
+    # 在进程内启动 apiport 并压测 30 秒
+    python bench_apiport.py --duration 30 --concurrency 200 --mix 70:20:10
+    # 压测已部署的服务（被测服务需能访问本机的监听端口）
+    python bench_apiport.py --url http://127.0.0.1:10080 --mode batch --batch-size 500
+
+同一 (ip, port) 的结果会被服务端缓存，想测真实探测路径时可加大 --listeners/--refused 端口池，
+或使用 --attempts 2 以上（多次探测判定不走缓存）。
+"""
+import argparse
+import http.client
+import json
+import random
+import selectors
+import socket
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+parser = argparse.ArgumentParser(description="端口检测服务压测")
+parser.add_argument("--url", type=str, default=None, help="被测服务地址，不填则在进程内启动 apiport")
+parser.add_argument("--mode", choices=["single", "batch"], default="single", help="single: /check_port，batch: /check_ports")
+parser.add_argument("--concurrency", type=int, default=50, help="并发请求数")
+parser.add_argument("--duration", type=float, default=10, help="压测时长（秒）")
+parser.add_argument("--mix", type=str, default="70:20:10", help="开放:拒绝:黑洞 目标的比例")
+parser.add_argument("--listeners", type=int, default=100, help="本地开放端口数量")
+parser.add_argument("--refused", type=int, default=100, help="本地关闭端口数量")
+parser.add_argument("--blackhole", type=str, default="10.255.255.1", help="不可路由的黑洞地址")
+parser.add_argument("--timeout", type=float, default=1.0, help="服务端单次探测超时（秒）")
+parser.add_argument("--attempts", type=int, default=1, help="服务端探测次数")
+parser.add_argument("--batch-size", type=int, default=200, help="batch 模式下每个请求的目标数")
+parser.add_argument("--clients", type=int, default=1, help="模拟的客户端数量（X-Client-Id）")
+
+
+def start_listeners(count):
+    """启动 count 个监听端口，后台线程用 selector 接受连接后立即关闭，避免 accept 队列被占满"""
+    selector = selectors.DefaultSelector()
+    sockets = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1024)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        sockets.append(sock)
+
+    def accept_loop():
+        while True:
+            for key, _ in selector.select():
+                try:
+                    conn, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                conn.close()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return sockets
+
+
+def refused_ports(count):
+    """找 count 个当前没有监听的端口：绑定后立即关闭"""
+    ports = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        ports.append(sock.getsockname()[1])
+        sock.close()
+    return ports
+
+
+def start_server():
+    """在后台线程里启动 apiport，返回服务地址"""
+    from werkzeug.serving import make_server
+    import apiport
+    server = make_server('127.0.0.1', 0, apiport.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Bench:
+    def __init__(self, args, base_url, targets):
+        self.args = args
+        self.url = urlsplit(base_url)
+        self.targets = targets  # [(kind, ip, port), ...]
+        self.weights = [int(w) for w in args.mix.split(':')]
+        self.latencies = []
+        self.outcomes = Counter()
+        self.probes = 0
+        self.lock = threading.Lock()
+
+    def pick(self):
+        kind = random.choices(['open', 'refused', 'blackhole'], self.weights)[0]
+        return random.choice(self.targets[kind])
+
+    def worker(self, index, deadline):
+        conn = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.args.timeout * 10 + 30)
+        headers = {'X-Client-Id': f'bench-{index % self.args.clients}'}
+        latencies, outcomes, probes = [], Counter(), 0
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                if self.args.mode == 'single':
+                    ip, port = self.pick()
+                    query = urlencode({'ip': ip, 'port': port, 'timeout': self.args.timeout, 'attempts': self.args.attempts})
+                    conn.request('GET', f'/check_port?{query}', headers=headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    if response.status == 200:
+                        outcomes[json.loads(body)['status']] += 1
+                        probes += 1
+                    else:
+                        outcomes[f'http_{response.status}'] += 1
+                else:
+                    batch = [self.pick() for _ in range(self.args.batch_size)]
+                    payload = json.dumps({'timeout': self.args.timeout, 'concurrency': self.args.batch_size,
+                                          'targets': [{'ip': ip, 'port': port} for ip, port in batch]})
+                    conn.request('POST', '/check_ports', body=payload,
+                                 headers=dict(headers, **{'Content-Type': 'application/json'}))
+                    response = conn.getresponse()
+                    body = response.read()
+                    if response.status == 200:
+                        for line in body.splitlines():
+                            outcomes[json.loads(line)['status']] += 1
+                            probes += 1
+                    else:
+                        outcomes[f'http_{response.status}'] += 1
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                outcomes[f'error_{type(e).__name__}'] += 1
+                conn.close()
+                continue
+            latencies.append(time.monotonic() - start)
+        conn.close()
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.outcomes.update(outcomes)
+            self.probes += probes
+
+    def run(self):
+        deadline = time.monotonic() + self.args.duration
+        started = time.monotonic()
+        threads = [threading.Thread(target=self.worker, args=(i, deadline)) for i in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - started
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        print(f"mode={self.args.mode} concurrency={self.args.concurrency} mix={self.args.mix} "
+              f"timeout={self.args.timeout}s attempts={self.args.attempts} elapsed={elapsed:.2f}s")
+        print(f"requests: {len(latencies)}  ({len(latencies) / elapsed:.1f} req/s)")
+        print(f"probes:   {self.probes}  ({self.probes / elapsed:.1f} probes/s)")
+        print("outcomes: " + ', '.join(f"{k}={v}" for k, v in sorted(self.outcomes.items())))
+        print("latency:  " + '  '.join(f"p{p}={percentile(latencies, p) * 1000:.1f}ms" for p in (50, 95, 99))
+              + f"  max={(latencies[-1] if latencies else 0) * 1000:.1f}ms")
+
+
+def main():
+    args = parser.parse_args()
+    listeners = start_listeners(args.listeners)
+    targets = {
+        'open': [('127.0.0.1', sock.getsockname()[1]) for sock in listeners],
+        'refused': [('127.0.0.1', port) for port in refused_ports(args.refused)],
+        'blackhole': [(args.blackhole, port) for port in range(20000, 20000 + max(args.refused, 1))],
+    }
+    base_url = args.url or start_server()
+    bench = Bench(args, base_url, targets)
+    elapsed = bench.run()
+    bench.report(elapsed)
+    for sock in listeners:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,10 @@ import logging
 from uuid import uuid4
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+from logsetup import setup_logging
 
 # 配置日志记录，包括时间戳、日志级别和消息
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+setup_logging(logging.INFO, fmt='%(asctime)s - %(levelname)s - %(message)s')
 
 
 def read_credentials(filename):
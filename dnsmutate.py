@@ -0,0 +1,127 @@
+"""阿里云解析记录的写操作执行器，供 awsdns.py、az.py、dnsshan.py 共用
+
+所有添加/删除请求先经过令牌桶限速，再由线程池并发发出；遇到限流错误时按指数退避（带随机抖动）重试，
+同时让整个令牌桶暂停一段时间，避免其它线程继续撞上限流。dry_run 模式下只打印计划变更，不调用 API：
+
+    from dnsmutate import MutationExecutor
+    mutator = MutationExecutor(ali_client, qps=10)
+    futures = [mutator.delete(record_id) for record_id in stale_ids]
+    mutator.wait(futures)
+"""
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from aliyunsdkcore.acs_exception.exceptions import ServerException
+from aliyunsdkalidns.request.v20150109 import AddDomainRecordRequest, DeleteDomainRecordRequest
+
+DEFAULT_QPS = 10  # 默认每秒最多发出的写请求数
+MAX_RETRIES = 5  # 限流错误的最大重试次数
+BASE_BACKOFF = 0.5  # 首次退避时间（秒）
+MAX_BACKOFF = 10  # 单次退避时间上限（秒）
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(error):
+    """判断是否为限流类错误（Throttling、Throttling.User、Throttling.Api 等，或服务暂时不可用）"""
+    if not isinstance(error, ServerException):
+        return False
+    code = error.get_error_code() or ''
+    return code.startswith('Throttling') or code == 'ServiceUnavailable' or error.get_http_status() == 503
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不够时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                else:
+                    delay = self._paused_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """暂停发放令牌 seconds 秒，并清空积攒的令牌"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+class MutationExecutor:
+    """限速、并发、可退避的解析记录写操作执行器"""
+
+    def __init__(self, client, qps=DEFAULT_QPS, workers=None, dry_run=False, max_retries=MAX_RETRIES):
+        self.client = client
+        self.dry_run = dry_run
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(qps)
+        self._executor = ThreadPoolExecutor(max_workers=workers or max(1, int(qps)), thread_name_prefix='dns-mutate')
+
+    def add(self, domain, rr, record_type, value, ttl=600, line='default'):
+        """添加一条解析记录，返回 Future，结果为新记录的 RecordId（dry_run 时为 None）"""
+        request = AddDomainRecordRequest.AddDomainRecordRequest()
+        request.set_accept_format('json')
+        request.set_DomainName(domain)
+        request.set_RR(rr)
+        request.set_Type(record_type)
+        request.set_Value(value)
+        request.set_TTL(ttl)
+        request.set_Line(line)
+        description = f"添加 {rr}.{domain} {record_type} {value}（线路 {line}，TTL {ttl}）"
+        return self._submit(request, description)
+
+    def delete(self, record_id, description=None):
+        """删除一条解析记录，返回 Future"""
+        request = DeleteDomainRecordRequest.DeleteDomainRecordRequest()
+        request.set_accept_format('json')
+        request.set_RecordId(record_id)
+        return self._submit(request, f"删除记录 {record_id}" + (f"（{description}）" if description else ''))
+
+    def _submit(self, request, description):
+        if self.dry_run:
+            print(f"[dry-run] {description}")
+            future = Future()
+            future.set_result(None)
+            return future
+        return self._executor.submit(self._call, request, description)
+
+    def _call(self, request, description):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = json.loads(self.client.do_action_with_exception(request))
+                return response.get('RecordId')
+            except Exception as e:
+                if not is_throttled(e) or attempt == self.max_retries:
+                    raise
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1)
+                logger.warning(f"{description} 被限流，{delay:.1f} 秒后重试（{attempt + 1}/{self.max_retries}）：{e}")
+                self.bucket.pause(delay)
+                time.sleep(delay)
+
+    @staticmethod
+    def wait(futures):
+        """等待一批操作完成，返回失败的 [(future, exception), ...]"""
+        wait(futures)
+        return [(future, future.exception()) for future in futures if future.exception() is not None]
@@ -0,0 +1,70 @@
+"""按期望状态调和阿里云解析记录，供 awsdns.py、az.py 共用
+
+调用方给出本轮期望存在的全部记录 {(RR, Type, Value, Line), ...}，与快照中的现有记录比较，
+只添加缺少的、删除多余的（包括重复记录），一次性经限速执行器并发发出：
+
+    from dnsreconcile import reconcile
+    desired = {('www', 'A', ip, 'default') for ip in all_ips}
+    reconcile(zone, mutator, desired, scope=[('www', 'A')], ttl=600)
+
+只有 scope 中的 (RR, Type) 受管理，其它主机记录和类型的记录不会被删除。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def record_key(record):
+    """解析记录在调和时的身份：(RR, Type, Value, Line)"""
+    return record['RR'], record['Type'], record['Value'], record.get('Line', 'default')
+
+
+def diff(live, desired):
+    """比较现有记录和期望记录，返回 (需要添加的 key 列表, 需要删除的记录列表)"""
+    kept = set()
+    to_delete = []
+    for record in live:
+        key = record_key(record)
+        if key in desired and key not in kept:
+            kept.add(key)
+        else:
+            to_delete.append(record)  # 不再需要，或者是重复记录
+    to_add = sorted(desired - kept, key=lambda key: tuple(str(part) for part in key))
+    return to_add, to_delete
+
+
+def reconcile(zone, mutator, desired, scope=None, ttl=600):
+    """把 scope 内的记录调和为 desired，成功的变更同步到 zone；返回 (添加数, 删除数, 失败数)
+
+    先添加再删除，替换期间子域名不会出现没有任何记录的空窗。
+    """
+    desired = set(desired)
+    scope = set(scope) if scope is not None else {(rr, record_type) for rr, record_type, _, _ in desired}
+    live = [record for rr, record_type in scope for record in zone.records(rr, record_type)]
+    to_add, to_delete = diff(live, {key for key in desired if key[:2] in scope})
+    failed = 0
+
+    adds = {mutator.add(zone.domain, rr, record_type, value, ttl, line): (rr, record_type, value, line)
+            for rr, record_type, value, line in to_add}
+    for future, (rr, record_type, value, line) in adds.items():
+        try:
+            record_id = future.result()
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error adding record {rr} {record_type} {value} (line {line}): {e}")
+            continue
+        if record_id:  # dry_run 时没有 RecordId，不写入快照
+            zone.add(record_id, rr, record_type, value, ttl, line)
+        logger.info(f"Added record {rr} {record_type} {value} (line {line}).")
+
+    deletes = {mutator.delete(record['RecordId'], record['Value']): record for record in to_delete}
+    for future, record in deletes.items():
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error deleting record {record['RecordId']}: {e}")
+            continue
+        zone.remove(record['RecordId'])
+        logger.info(f"Deleted record {record['RecordId']} with IP {record['Value']}.")
+    return len(to_add), len(to_delete), failed
@@ -0,0 +1,117 @@
+"""阿里云解析记录的查询，供 awsdns.py、az.py、dnsshan.py 共用
+
+DescribeDomainRecords 默认只返回第一页（20 条），这里按最大页大小分页并发拉取，
+并把主机记录、记录类型、记录值的过滤交给 API，只传回需要的记录：
+
+    from dnsrecords import list_records
+    records = list_records(ali_client, 'example.com', rr='www', record_type='A')
+
+轮询脚本每轮只需拉取一次记录，之后的查询和增删都在本地快照上完成：
+
+    zone = ZoneSnapshot(ali_client, 'example.com', rr='www')
+    zone.refresh()
+    zone.find('www', '1.2.3.4')
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aliyunsdkalidns.request.v20150109 import DescribeDomainRecordsRequest
+
+MAX_PAGE_SIZE = 500  # DescribeDomainRecords 允许的最大页大小
+DEFAULT_WORKERS = 4  # 并发拉取的页数
+
+
+def fetch_page(client, domain, page_number, page_size=MAX_PAGE_SIZE, rr=None, record_type=None, value=None):
+    """拉取一页记录，返回 (总条数, 本页记录列表)"""
+    request = DescribeDomainRecordsRequest.DescribeDomainRecordsRequest()
+    request.set_accept_format('json')
+    request.set_DomainName(domain)
+    request.set_PageNumber(page_number)
+    request.set_PageSize(page_size)
+    if rr or value:
+        # 高级搜索模式下可以分别按主机记录和记录值过滤（模糊匹配）
+        request.set_SearchMode('ADVANCED')
+        if rr:
+            request.set_RRKeyWord(rr)
+        if value:
+            request.set_ValueKeyWord(value)
+    if record_type:
+        request.set_Type(record_type)
+    response = json.loads(client.do_action_with_exception(request))
+    return response.get('TotalCount', 0), response.get('DomainRecords', {}).get('Record', [])
+
+
+def list_records(client, domain, rr=None, record_type=None, value=None, page_size=MAX_PAGE_SIZE,
+                 workers=DEFAULT_WORKERS):
+    """列出域名下的全部解析记录；rr、record_type、value 不为空时只返回精确匹配的记录"""
+    total, records = fetch_page(client, domain, 1, page_size, rr, record_type, value)
+    pages = -(-total // page_size)
+    if pages > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, pages - 1)) as executor:
+            futures = [executor.submit(fetch_page, client, domain, page, page_size, rr, record_type, value)
+                       for page in range(2, pages + 1)]
+            for future in futures:
+                records.extend(future.result()[1])
+
+    # API 的关键字是模糊匹配，翻页期间记录有变化时同一条记录也可能出现两次
+    matched = {}
+    for record in records:
+        if rr is not None and record.get('RR') != rr:
+            continue
+        if record_type is not None and record.get('Type') != record_type:
+            continue
+        if value is not None and record.get('Value') != value:
+            continue
+        matched[record['RecordId']] = record
+    return list(matched.values())
+
+
+class ZoneSnapshot:
+    """一轮轮询内的解析记录快照，按 (RR, Value) 和 (RR, Type) 建索引，增删记录后在本地同步更新"""
+
+    def __init__(self, client, domain, rr=None):
+        self.client = client
+        self.domain = domain
+        self.rr = rr
+        self._by_id = {}
+        self._by_value = {}  # (RR, Value) -> {RecordId: record}
+        self._by_type = {}  # (RR, Type) -> {RecordId: record}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """重新拉取记录（rr 不为空时只拉取该主机记录），替换整个快照"""
+        records = list_records(self.client, self.domain, rr=self.rr)
+        with self._lock:
+            self._by_id, self._by_value, self._by_type = {}, {}, {}
+            for record in records:
+                self._index(record)
+
+    def _index(self, record):
+        self._by_id[record['RecordId']] = record
+        self._by_value.setdefault((record['RR'], record['Value']), {})[record['RecordId']] = record
+        self._by_type.setdefault((record['RR'], record['Type']), {})[record['RecordId']] = record
+
+    def find(self, rr, value):
+        """返回主机记录为 rr、记录值为 value 的任意一条记录的 RecordId，没有则返回 None"""
+        with self._lock:
+            return next(iter(self._by_value.get((rr, value), {})), None)
+
+    def records(self, rr, record_type):
+        """返回主机记录为 rr、类型为 record_type 的全部记录"""
+        with self._lock:
+            return list(self._by_type.get((rr, record_type), {}).values())
+
+    def add(self, record_id, rr, record_type, value, ttl=600, line='default'):
+        """记录已经添加成功，同步到快照"""
+        with self._lock:
+            self._index({'RecordId': record_id, 'RR': rr, 'Type': record_type, 'Value': value,
+                         'TTL': ttl, 'Line': line, 'DomainName': self.domain})
+
+    def remove(self, record_id):
+        """记录已经删除成功，从快照中移除"""
+        with self._lock:
+            record = self._by_id.pop(record_id, None)
+            if record is None:
+                return
+            self._by_value.get((record['RR'], record['Value']), {}).pop(record_id, None)
+            self._by_type.get((record['RR'], record['Type']), {}).pop(record_id, None)
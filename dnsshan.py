@@ -1,65 +1,76 @@
 import logging
-import json
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logsetup import setup_logging
 from aliyunsdkcore.client import AcsClient
-from aliyunsdkalidns.request.v20150109 import DescribeDomainRecordsRequest, DeleteDomainRecordRequest
-from requests.exceptions import ConnectionError, Timeout, RequestException
+from dnsrecords import list_records
+from dnsmutate import MutationExecutor
+from healthcheck import HealthCheckClient
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志，重试日志每 10 秒最多输出一条
+setup_logging(logging.INFO, sample_interval=10)
 logger = logging.getLogger(__name__)
 
 # 阿里云API客户端初始化，请用您自己的Access Key ID和Access Key Secret替换下面的占位符
 client = AcsClient('<your-access-key-id>', '<your-access-key-secret>', 'cn-hangzhou')
+mutator = MutationExecutor(client, qps=10)
 
-def get_domain_records(domain):
-    """获取指定域名的所有DNS解析记录"""
-    request = DescribeDomainRecordsRequest()
-    request.set_DomainName(domain)
-    request.set_accept_format('json')
-    response = client.do_action_with_exception(request)
-    records = json.loads(response.decode('utf-8'))
-    return records['DomainRecords']['Record']
+def get_domain_records(domain, subdomains=None):
+    """获取指定域名的DNS解析记录，指定 subdomains 时只拉取这些主机记录"""
+    if subdomains is None:
+        return list_records(client, domain)
+    records = []
+    for rr in subdomains:
+        records.extend(list_records(client, domain, rr=rr))
+    return records
 
 def delete_dns_record(record_id):
-    """删除指定的DNS解析记录"""
-    request = DeleteDomainRecordRequest()
-    request.set_RecordId(record_id)
-    client.do_action_with_exception(request)
-    logger.info(f"已删除DNS记录：{record_id}")
+    """删除指定的DNS解析记录（经限速执行器排队），返回 Future"""
+    def log_result(future):
+        if future.exception() is None and not mutator.dry_run:
+            logger.info(f"已删除DNS记录：{record_id}")
 
-def check_port(api_url, ip, port=22, retries=10):
-    """检查指定IP的端口是否开放，带重试逻辑"""
-    for attempt in range(retries):
-        try:
-            response = requests.get(api_url, params={"ip": ip, "port": port}, timeout=10)
-            if response.status_code == 200 and response.json().get("open", False):
-                logger.info(f"端口在 {ip} 上开放")
-                return True
-            logger.info(f"尝试 {attempt + 1}/{retries}：端口在 {ip} 上未开放")
-        except ConnectionError:
-            logger.error(f"尝试 {attempt + 1}/{retries}：连接错误")
-        except Timeout:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求超时")
-        except RequestException as e:
-            logger.error(f"尝试 {attempt + 1}/{retries}：请求异常：{e}")
-        if attempt < retries - 1:
-            time.sleep(1)  # 稍等一秒再重试
-            logger.info("正在重试...")
-    return False
+    future = mutator.delete(record_id)
+    future.add_done_callback(log_result)
+    return future
 
-def process_domain_records(api_url, domain, subdomains, port=22):
-    """处理多个特定二级域名的所有DNS记录"""
-    records = get_domain_records(domain)
+def check_port(checker, ip, port=22, attempts=3):
+    """检查指定IP的端口是否开放；服务端并发探测 attempts 次，检测API不可用或拒绝请求时抛出 CheckApiUnavailable"""
+    is_open = checker.is_open(ip, port, attempts=attempts)
+    if is_open:
+        logger.info(f"端口在 {ip} 上开放")
+    else:
+        logger.info(f"端口在 {ip} 上未开放")
+    return is_open
+
+def process_domain_records(api_url, domain, subdomains, port=22, max_workers=32):
+    """处理多个特定二级域名的所有DNS记录：所有IP并发检测，每得到一个结果就处理对应记录"""
+    records = get_domain_records(domain, subdomains)
+    # 检查记录是否属于我们感兴趣的二级域名之一，同一个IP只检测一次
+    records_by_ip = {}
     for record in records:
-        # 检查记录是否属于我们感兴趣的二级域名之一
         if record['RR'] in subdomains and record['Type'] in ['A', 'AAAA']:  # A 或 AAAA 记录
-            ip = record['Value']
-            if not check_port(api_url, ip, port):
-                logger.error(f"端口在 {ip} 上未开放，删除记录：{record['RecordId']}")
-                delete_dns_record(record['RecordId'])
-            else:
-                logger.info(f"端口在 {ip} 上开放，保留记录：{record['RecordId']}")
+            records_by_ip.setdefault(record['Value'], []).append(record)
+    if not records_by_ip:
+        return
+    deletions = {}  # Future -> RecordId
+    checker = HealthCheckClient(api_url, pool_size=max_workers)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(records_by_ip))) as executor:
+        futures = {executor.submit(check_port, checker, ip, port): ip for ip in records_by_ip}
+        for future in as_completed(futures):
+            ip = futures[future]
+            try:
+                is_open = future.result()
+            except Exception as e:
+                logger.error(f"检测 {ip} 时出错，保留记录：{e}")
+                continue
+            for record in records_by_ip[ip]:
+                if not is_open:
+                    logger.error(f"端口在 {ip} 上未开放，删除记录：{record['RecordId']}")
+                    deletions[delete_dns_record(record['RecordId'])] = record['RecordId']
+                else:
+                    logger.info(f"端口在 {ip} 上开放，保留记录：{record['RecordId']}")
+    for future, error in mutator.wait(list(deletions)):
+        logger.error(f"删除记录 {deletions[future]} 失败：{error}")
 
 if __name__ == "__main__":
     # 示例：请替换以下变量值
@@ -67,4 +78,6 @@ if __name__ == "__main__":
     domain = "example.com"  # 主域名
     subdomains = ["sub1", "sub2", "sub3"]  # 需要检查的二级域名前缀列表
     port = 22  # 需要检查的端口
-    process_domain_records(api_url, domain, subdomains, port)
+    max_workers = 32  # 同时检测的IP数量上限
+    mutator.dry_run = False  # 设为 True 时只打印计划删除的记录
+    process_domain_records(api_url, domain, subdomains, port, max_workers)
@@ -0,0 +1,134 @@
+"""端口检测 API（apiport.py 的 /check_port）的客户端，供 awsdns.py、az.py、dnsshan.py 共用
+
+所有请求共用一个 requests.Session，连接池里的长连接反复使用，不必每次重新握手。
+只有检测 API 本身出错（连接失败、超时、5xx、429）时才重试，重试间隔按指数退避并带随机抖动。
+连续失败达到阈值后熔断：reset_timeout 秒内的请求直接抛出 CheckApiUnavailable，不再打到 API 上，
+之后放一个请求试探，成功即恢复：
+
+    from healthcheck import HealthCheckClient, CheckApiUnavailable
+    checker = HealthCheckClient('http://127.0.0.1:10080/check_port')
+    try:
+        is_open = checker.is_open('1.2.3.4', 22, attempts=3)
+    except CheckApiUnavailable:
+        ...  # 检测 API 不可用，端口状态未知，不要据此换 IP 或删除记录
+"""
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+DEFAULT_TIMEOUT = 10  # 单次请求超时（秒）
+DEFAULT_RETRIES = 3
+BASE_BACKOFF = 0.5  # 首次重试前的等待时间（秒）
+MAX_BACKOFF = 8  # 单次等待时间上限（秒）
+FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+RESET_TIMEOUT = 30  # 熔断持续时间（秒）
+
+logger = logging.getLogger(__name__)
+
+
+class CheckApiUnavailable(Exception):
+    """检测 API 不可用（重试耗尽或已熔断），端口状态未知"""
+
+
+class CheckRequestRejected(CheckApiUnavailable):
+    """检测 API 拒绝了请求（4xx，通常是参数配置错误），端口状态同样未知"""
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，reset_timeout 秒后半开，放行一个试探请求"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False  # 半开状态下是否已有试探请求在进行
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许发出请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def retry_after(self):
+        """距离下次试探还要多少秒，未熔断时为 0"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning("检测API已恢复，关闭熔断")
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    logger.error(f"检测API连续失败 {self._failures} 次，熔断 {self.reset_timeout} 秒")
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class HealthCheckClient:
+    """带连接池、退避重试和熔断的 /check_port 客户端，可在多个线程间共用"""
+
+    def __init__(self, api_url, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, pool_size=32,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def check(self, ip, port, attempts=1, quorum=1):
+        """返回检测结果（/check_port 的 JSON）；检测 API 不可用或拒绝请求时抛出 CheckApiUnavailable"""
+        params = {"ip": ip, "port": port, "attempts": attempts, "quorum": quorum}
+        for attempt in range(self.retries):
+            if not self.breaker.allow():
+                raise CheckApiUnavailable(f"检测API已熔断，{self.breaker.retry_after():.1f} 秒后重试")
+            try:
+                response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+            except RequestException as e:
+                error = f"请求错误：{e}"
+            else:
+                if response.status_code == 200:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        error = "无法解析JSON响应"
+                    else:
+                        self.breaker.record_success()
+                        return result
+                elif response.status_code < 500 and response.status_code != 429:
+                    # 参数错误之类的问题重试也没用，也不代表 API 不可用，但端口状态同样未知
+                    self.breaker.record_success()
+                    raise CheckRequestRejected(f"API返回非200状态码：{response.status_code} {response.text[:200]}")
+                else:
+                    error = f"API返回非200状态码：{response.status_code}"
+            self.breaker.record_failure()
+            logger.error(f"{ip} 尝试 {attempt + 1}/{self.retries}：{error}", extra={'sample': 'check-api-retry'})
+            if attempt < self.retries - 1:
+                time.sleep(min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1))
+        raise CheckApiUnavailable(f"检测 {ip}:{port} 时所有重试均失败")
+
+    def is_open(self, ip, port, attempts=1, quorum=1):
+        """端口是否开放；检测 API 不可用时抛出 CheckApiUnavailable"""
+        return bool(self.check(ip, port, attempts, quorum).get("open", False))
@@ -1,39 +1,149 @@
 from flask import Flask, jsonify, request, abort
+import os
 import logging
-from logging.handlers import RotatingFileHandler
+from ipstore import IpStore
+from logsetup import setup_logging
 
 app = Flask(__name__)
 
-# 日志配置
-logging.basicConfig(level=logging.INFO)
-handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=3)
+# 日志配置：写日志在后台线程完成，文件 10MB 滚动；多 worker 部署时各进程会各自滚动同一个文件，
+# 建议通过 IPAPI_LOG 给每个实例指定不同文件，或留空只输出到终端
+setup_logging(logging.INFO, filename=os.getenv('IPAPI_LOG', 'app.log'), max_bytes=10 * 1024 * 1024, backup_count=3)
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-logger.addHandler(handler)
 
-# 简单的内存存储解决方案
-ip_store = {}
+# 持久化存储，数据库路径可通过环境变量 IPAPI_DB 指定
+ip_store = IpStore(os.getenv('IPAPI_DB', 'ips.db'))
+
+# 分页配置
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 10000
+
+# 长轮询配置
+DEFAULT_WATCH_TIMEOUT = 30
+MAX_WATCH_TIMEOUT = 60
 
 @app.route('/ips', methods=['GET'])
 def get_ips():
-    return jsonify(ip_store)
+    """获取 IP 列表
+
+    - 无参数：返回全部 {name: ip}
+    - ?limit=N&cursor=<name>：按 name 分页，返回 {"ips", "next_cursor", "version"}
+    - ?since=<version>：只返回该版本之后的变化 {"version", "full", "upserts", "deleted"}
+    响应带 ETag，客户端携带 If-None-Match 且数据没有变化时返回 304。
+    """
+    version = ip_store.version()
+    etag = f"{version}-{request.query_string.decode()}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    since = request.args.get('since', type=int)
+    if since is not None:
+        body = ip_store.changes_since(since)
+    elif 'limit' in request.args or 'cursor' in request.args:
+        limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            abort(400, description=f"limit must be between 1 and {MAX_PAGE_LIMIT}.")
+        ips, next_cursor, version = ip_store.page(request.args.get('cursor'), limit)
+        body = {'ips': ips, 'next_cursor': next_cursor, 'version': version}
+    else:
+        body = ip_store.all()
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['X-Store-Version'] = str(version)
+    return response
 
 @app.route('/ips', methods=['POST'])
 def add_ip():
     if not request.is_json:
         abort(400, description="Invalid data format. JSON required.")
     data = request.get_json()
-    if 'name' not in data or 'ip' not in data:
+    if not isinstance(data, dict) or 'name' not in data or 'ip' not in data:
         abort(400, description="Invalid data. Please provide 'name' and 'ip'.")
-    ip_store[data['name']] = data['ip']
+    if not isinstance(data['name'], str) or not isinstance(data['ip'], str):
+        abort(400, description="Invalid data. Names and IPs must be strings.")
+    ip_store.set(data['name'], data['ip'])
     logger.info(f"Added IP: {data['name']} - {data['ip']}")
     return jsonify({"message": "IP added successfully"}), 201
 
+@app.route('/ips/watch', methods=['GET'])
+def watch_ips():
+    """长轮询：/ips/watch?version=<version>&timeout=30
+
+    阻塞到版本号超过 version 后返回变化（格式同 GET /ips?since=），超时仍无变化返回 304；
+    version 比服务端当前版本还新（数据库被重建）时立即返回全量。
+    """
+    version = request.args.get('version', type=int)
+    if version is None:
+        abort(400, description="Missing or invalid 'version' parameter.")
+    timeout = request.args.get('timeout', DEFAULT_WATCH_TIMEOUT, type=float)
+    if not 0 <= timeout <= MAX_WATCH_TIMEOUT:
+        abort(400, description=f"timeout must be between 0 and {MAX_WATCH_TIMEOUT}.")
+    if ip_store.wait_for_change(version, timeout) is None:
+        return app.response_class(status=304)
+    return jsonify(ip_store.changes_since(version))
+
+@app.route('/ips/lookup', methods=['GET'])
+def lookup_ip():
+    """按 IP 反查 name：/ips/lookup?ip=1.2.3.4"""
+    ip = request.args.get('ip')
+    if not ip:
+        abort(400, description="Missing 'ip' parameter.")
+    names = ip_store.names_for_ip(ip)
+    if not names:
+        abort(404, description=f"No name found for IP '{ip}'.")
+    return jsonify({"ip": ip, "names": names})
+
+@app.route('/ips/range', methods=['GET'])
+def ips_in_range():
+    """按网段查询：/ips/range?cidr=10.0.0.0/16&limit=100，返回 {name: ip}"""
+    cidr = request.args.get('cidr')
+    if not cidr:
+        abort(400, description="Missing 'cidr' parameter.")
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        abort(400, description="limit must be positive.")
+    try:
+        return jsonify(ip_store.in_network(cidr, limit))
+    except ValueError as e:
+        abort(400, description=f"Invalid CIDR '{cidr}': {e}")
+
+@app.route('/ips/batch', methods=['POST'])
+def batch_ips():
+    """批量写入和删除，整批在一个事务里生效
+
+    请求体示例：{"upserts": {"node1": "1.2.3.4"} 或 [{"name": "node1", "ip": "1.2.3.4"}], "deletes": ["node2"]}
+    """
+    if not request.is_json:
+        abort(400, description="Invalid data format. JSON required.")
+    data = request.get_json()
+    if not isinstance(data, dict):
+        abort(400, description="Invalid data. JSON object required.")
+    upserts = data.get('upserts') or {}
+    if isinstance(upserts, list):
+        if not all(isinstance(item, dict) and 'name' in item and 'ip' in item for item in upserts):
+            abort(400, description="Invalid upserts. Each item must provide 'name' and 'ip'.")
+        upserts = {item['name']: item['ip'] for item in upserts}
+    deletes = data.get('deletes') or []
+    if not isinstance(upserts, dict) or not isinstance(deletes, list):
+        abort(400, description="Invalid data. 'upserts' must be an object or list, 'deletes' a list.")
+    if not all(isinstance(name, str) and isinstance(ip, str) for name, ip in upserts.items()) \
+            or not all(isinstance(name, str) for name in deletes):
+        abort(400, description="Invalid data. Names and IPs must be strings.")
+    conflicts = set(upserts) & set(deletes)
+    if conflicts:
+        abort(400, description=f"Names both upserted and deleted: {sorted(conflicts)}")
+    version, deleted = ip_store.apply(upserts, deletes)
+    not_found = sorted(set(deletes) - set(deleted))
+    logger.info(f"Batch applied: {len(upserts)} upserted, {len(deleted)} deleted, "
+                f"{len(not_found)} not found, version {version}")
+    return jsonify({"message": "Batch applied successfully", "version": version, "upserted": len(upserts),
+                    "deleted": len(deleted), "not_found": not_found})
+
 @app.route('/ips/<name>', methods=['DELETE'])
 def delete_ip(name):
-    if name not in ip_store:
+    if not ip_store.delete(name):
         abort(404, description=f"IP with name '{name}' not found.")
-    del ip_store[name]
     logger.info(f"Deleted IP: {name}")
     return jsonify({"message": "IP deleted successfully"})
 
@@ -49,5 +159,9 @@ def not_found(error):
 def internal_error(error):
     return jsonify(error=str(error)), 500
 
+# 开发调试：python ipapi.py（设置 FLASK_DEBUG=1 开启调试模式）
+# 生产部署：多个 worker 进程共享同一个数据库文件，例如
+#   IPAPI_DB=/var/lib/ipapi/ips.db gunicorn -w 4 --threads 32 -b 0.0.0.0:5000 ipapi:app
+# /ips/watch 长轮询会占住处理线程，需要使用带线程的 worker（--threads）
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,239 @@
+"""ipapi 的持久化存储：SQLite（WAL 模式）
+
+写入只追加到 WAL 文件，synchronous=NORMAL 下不会每次写都 fsync；重启时不需要把数据加载进内存，
+打开数据库即可提供服务，几十万条记录也能瞬间启动。
+
+多个 worker 进程（如 gunicorn 预派生模式）打开同一个数据库文件即可共享数据：WAL 模式下读不阻塞写，
+写操作用 BEGIN IMMEDIATE 串行化，提交后所有进程的下一次读取立即可见。
+
+每条记录的 IP 另存一份整数编码（ip_key，1 字节地址族 + 大端地址）并建 B 树索引，
+按 IP 反查 name 和按 CIDR 网段查询都是一次对数时间的索引查找/范围扫描。
+
+每次写入都会让全局版本号加一，并记在被修改的行上（删除则记在 tombstones 表中），
+据此可以回答“某个版本之后变了什么”。超过 TOMBSTONE_RETENTION 个版本的删除记录会被清理，
+更早的版本只能拿到全量数据。
+"""
+import ipaddress
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+BUSY_TIMEOUT_MS = 5000  # 写锁被占用时的最长等待时间
+CHANGE_POLL_INTERVAL = 0.05  # 等待变化时检查其他进程写入的间隔（秒），本进程的写入会立即唤醒
+TOMBSTONE_RETENTION = 100000  # 删除记录保留的版本数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ips (name TEXT PRIMARY KEY, ip TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0, ip_key BLOB) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tombstones (name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS ips_version ON ips (version);
+CREATE INDEX IF NOT EXISTS ips_ip_key ON ips (ip_key);
+CREATE INDEX IF NOT EXISTS tombstones_version ON tombstones (version);
+"""
+
+
+def ip_key(ip):
+    """把 IP 字符串编码成可按字节序比较的 BLOB，非法 IP 返回 None（不进入索引）"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    return bytes([address.version]) + address.packed
+
+
+def network_range(cidr):
+    """返回 CIDR 网段在 ip_key 编码下的闭区间 (最小, 最大)，格式错误时抛出 ValueError"""
+    network = ipaddress.ip_network(cidr, strict=False)
+    prefix = bytes([network.version])
+    return prefix + network.network_address.packed, prefix + network.broadcast_address.packed
+
+
+class IpStore:
+    """name -> ip 的持久化映射，每个进程的每个线程使用自己的连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._generation = 0  # 本进程每次写入后加一
+        self._polled = (-1, 0.0, 0)  # 等待者共享的最近一次查询：(generation, 时间, 版本号)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._write() as conn:
+            for statement in SCHEMA.strip().split(';\n'):
+                conn.execute(statement)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(ips)")]
+            if 'version' not in columns:  # 旧版本的数据库没有 version 列
+                conn.execute("ALTER TABLE ips ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if 'ip_key' not in columns:  # 旧版本的数据库没有 ip_key 列，补齐已有记录
+                conn.execute("ALTER TABLE ips ADD COLUMN ip_key BLOB")
+                conn.executemany("UPDATE ips SET ip_key = ? WHERE name = ?",
+                                 [(ip_key(ip), name) for name, ip in conn.execute("SELECT name, ip FROM ips").fetchall()])
+            for statement in INDEXES.strip().split(';\n'):
+                conn.execute(statement)
+
+    def _conn(self):
+        local = self._local
+        # fork 之后子进程不能复用父进程的连接，按 pid 重新打开
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            local.conn.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _write(self):
+        """写事务：一开始就拿写锁，避免多个进程从读事务升级时互相等待"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    @contextmanager
+    def _read(self):
+        """读事务：事务内的多次查询看到同一个快照"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _version(conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @classmethod
+    def _bump(cls, conn):
+        """在写事务中把全局版本号加一并返回新版本号"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return cls._version(conn)
+
+    def version(self):
+        """当前版本号，每次成功写入后递增"""
+        return self._version(self._conn())
+
+    def wait_for_change(self, version, timeout):
+        """阻塞直到当前版本号大于 version，返回新版本号；超时返回 None
+
+        version 比当前版本还新（数据库被重建）时立即返回当前版本号，调用方应按 changes_since 做全量同步。
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                current = self._polled_version()
+                if current != version:
+                    return current
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(min(remaining, CHANGE_POLL_INTERVAL))
+
+    def _polled_version(self):
+        """持有 self._changed 时调用；所有等待者在一个检查间隔内共用一次查询，本进程有写入时立即重新查询"""
+        generation, polled_at, version = self._polled
+        now = time.monotonic()
+        if generation != self._generation or now - polled_at >= CHANGE_POLL_INTERVAL:
+            version = self.version()
+            self._polled = (self._generation, now, version)
+        return version
+
+    def all(self):
+        """返回全部 {name: ip}"""
+        return dict(self._conn().execute("SELECT name, ip FROM ips"))
+
+    def get(self, name):
+        row = self._conn().execute("SELECT ip FROM ips WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def names_for_ip(self, ip):
+        """按 IP 反查 name 列表"""
+        key = ip_key(ip)
+        if key is None:
+            return []
+        return [row[0] for row in self._conn().execute("SELECT name FROM ips WHERE ip_key = ? ORDER BY name", (key,))]
+
+    def in_network(self, cidr, limit=None):
+        """返回 IP 落在 CIDR 网段内的 {name: ip}，按地址排序；cidr 格式错误时抛出 ValueError"""
+        low, high = network_range(cidr)
+        return dict(self._conn().execute("SELECT name, ip FROM ips WHERE ip_key BETWEEN ? AND ? ORDER BY ip_key LIMIT ?",
+                                         (low, high, -1 if limit is None else limit)))
+
+    def page(self, cursor=None, limit=1000):
+        """按 name 排序分页，返回 ({name: ip}, 下一页游标或 None, 版本号)"""
+        with self._read() as conn:
+            rows = conn.execute("SELECT name, ip FROM ips WHERE name > ? ORDER BY name LIMIT ?",
+                                (cursor or '', limit + 1)).fetchall()
+            version = self._version(conn)
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return dict(rows[:limit]), next_cursor, version
+
+    def changes_since(self, since):
+        """返回 since 版本之后的变化：{'version', 'full', 'upserts', 'deleted'}
+
+        since 为 0、太旧（删除记录已被清理）或比当前版本还新（数据库被重建）时返回全量，full 为 True。
+        """
+        with self._read() as conn:
+            version = self._version(conn)
+            if since <= 0 or since < version - TOMBSTONE_RETENTION or since > version:
+                return {'version': version, 'full': True,
+                        'upserts': dict(conn.execute("SELECT name, ip FROM ips")), 'deleted': []}
+            upserts = dict(conn.execute("SELECT name, ip FROM ips WHERE version > ?", (since,)))
+            deleted = [row[0] for row in conn.execute("SELECT name FROM tombstones WHERE version > ?", (since,))]
+        return {'version': version, 'full': False, 'upserts': upserts, 'deleted': deleted}
+
+    def set(self, name, ip):
+        with self._write() as conn:
+            version = self._bump(conn)
+            conn.execute("INSERT INTO ips (name, ip, version, ip_key) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET ip = excluded.ip, version = excluded.version, "
+                         "ip_key = excluded.ip_key", (name, ip, version, ip_key(ip)))
+            conn.execute("DELETE FROM tombstones WHERE name = ?", (name,))
+
+    def delete(self, name):
+        """删除成功返回 True，不存在返回 False"""
+        with self._write() as conn:
+            if conn.execute("DELETE FROM ips WHERE name = ?", (name,)).rowcount == 0:
+                return False
+            version = self._bump(conn)
+            conn.execute("INSERT OR REPLACE INTO tombstones (name, version) VALUES (?, ?)", (name, version))
+            conn.execute("DELETE FROM tombstones WHERE version <= ?", (version - TOMBSTONE_RETENTION,))
+            return True
+
+    def apply(self, upserts, deletes):
+        """在一个事务里批量写入 {name: ip} 并删除 names，整批共用一个新版本号。
+
+        返回 (版本号, 实际删除的 name 列表)；不存在的 name 跳过，不影响其余操作。
+        没有写入也没有实际删除任何记录时版本号不变，不会唤醒 watch 的长轮询。
+        """
+        with self._write() as conn:
+            version = self._bump(conn) if upserts else None
+            conn.executemany("INSERT INTO ips (name, ip, version, ip_key) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT(name) DO UPDATE SET ip = excluded.ip, version = excluded.version, "
+                             "ip_key = excluded.ip_key", [(name, ip, version, ip_key(ip)) for name, ip in upserts.items()])
+            conn.executemany("DELETE FROM tombstones WHERE name = ?", [(name,) for name in upserts])
+            deleted = [name for name in deletes
+                       if conn.execute("DELETE FROM ips WHERE name = ?", (name,)).rowcount]
+            if not deleted:
+                return (self._version(conn) if version is None else version), deleted
+            if version is None:
+                version = self._bump(conn)
+            conn.executemany("INSERT OR REPLACE INTO tombstones (name, version) VALUES (?, ?)",
+                             [(name, version) for name in deleted])
+            conn.execute("DELETE FROM tombstones WHERE version <= ?", (version - TOMBSTONE_RETENTION,))
+        return version, deleted
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM ips").fetchone()[0]
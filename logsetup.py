@@ -0,0 +1,122 @@
+"""各服务和轮询脚本共用的日志配置
+
+日志记录只放进内存队列，由后台 QueueListener 线程负责格式化、写终端和滚动写文件，
+请求线程和主循环不会因为磁盘 I/O 阻塞：
+
+    from logsetup import setup_logging
+    setup_logging(filename='app.log', sample_interval=10)
+    logger.error(f"尝试 {attempt}/{retries}：请求超时", extra={'sample': 'connect-retry'})
+
+带 extra={'sample': key} 的重复日志（比如每次重试都打印的那种）可以按 key 采样，
+每 sample_interval 秒只输出一条，并注明期间省略了多少条。
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 单个日志文件 50MB 后滚动
+DEFAULT_BACKUP_COUNT = 5
+
+
+class SamplingFilter(logging.Filter):
+    """按 record.sample 分组采样，每组每 interval 秒放行一条"""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._groups = {}  # key -> [上次放行时间, 之后被省略的条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get(key)
+            if group is not None and now - group[0] < self.interval:
+                group[1] += 1
+                return False
+            suppressed = group[1] if group is not None else 0
+            self._groups[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()}（上一条之后省略了 {suppressed} 条同类日志）"
+            record.args = None
+        return True
+
+
+_current = {}  # 当前生效的 QueueHandler、QueueListener 和用于重建 handler 的参数
+_hooks_registered = False
+
+
+def _make_handlers(filename, fmt, max_bytes, backup_count):
+    formatter = logging.Formatter(fmt)
+    handlers = [logging.StreamHandler()]
+    if filename:
+        handlers.append(RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _stop():
+    listener = _current.get('listener')
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+def _before_fork():
+    # fork 前把队列里的日志全部写完并停下后台线程，子进程不会继承写了一半的队列或被占用的锁
+    _stop()
+
+
+def _after_fork_in_parent():
+    listener = _current.get('listener')
+    if listener is not None:
+        listener.start()
+
+
+def _after_fork_in_child():
+    # 子进程换用新的队列和 handler，不复用父进程的
+    if not _current:
+        return
+    for handler in _current['listener'].handlers:
+        handler.close()
+    log_queue = queue.SimpleQueue()
+    _current['queue_handler'].queue = log_queue
+    _current['listener'] = QueueListener(log_queue, *_make_handlers(*_current['config']), respect_handler_level=True)
+    _current['listener'].start()
+
+
+def setup_logging(level=logging.INFO, filename=None, fmt=DEFAULT_FORMAT, max_bytes=DEFAULT_MAX_BYTES,
+                  backup_count=DEFAULT_BACKUP_COUNT, sample_interval=0):
+    """配置根 logger：输出到终端，filename 不为空时同时滚动写文件；返回已启动的 QueueListener"""
+    global _hooks_registered
+    _stop()
+    config = (filename, fmt, max_bytes, backup_count)
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    if sample_interval:
+        queue_handler.addFilter(SamplingFilter(sample_interval))
+    listener = QueueListener(log_queue, *_make_handlers(*config), respect_handler_level=True)
+    listener.start()
+    _current.update(queue_handler=queue_handler, listener=listener, config=config)
+    if not _hooks_registered:
+        atexit.register(_stop)  # 退出前把队列里剩余的日志写完
+        if hasattr(os, 'register_at_fork'):
+            # 预派生的 worker 进程里没有父进程的后台线程
+            os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent,
+                                after_in_child=_after_fork_in_child)
+        _hooks_registered = True
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    return listener
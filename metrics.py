@@ -0,0 +1,140 @@
+"""进程内的轻量监控指标，按 Prometheus 文本格式导出
+
+    from metrics import Counter, Histogram, render
+    PROBES = Counter('probes_total', '探测次数', ['status'])
+    PROBES.inc('open')
+    print(render())
+
+每个指标只有一把锁，热路径上只做一次字典查找和加法，不依赖 prometheus_client。
+"""
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值元组 -> 数值
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _check(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+
+    def samples(self):
+        """返回 [(名称后缀, 标签值元组, 额外标签, 数值), ...]"""
+        with self._lock:
+            return [('', labels, None, value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, labels, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """可增可减的当前值；传入 func 时在导出时调用 func() 取值（仅支持无标签）"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def inc(self, *labels, amount=1):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        if self.func is not None:
+            return [('', (), None, self.func())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """累积分桶直方图"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        self._check(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # 各桶计数（最后一个是 +Inf）、总和、次数
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            states = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        samples = []
+        for labels, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', labels, ('le', _format_value(float(bound))), cumulative))
+            samples.append(('_sum', labels, None, total))
+            samples.append(('_count', labels, None, count))
+        return samples
+
+
+def render():
+    """把所有已注册指标渲染成 Prometheus 文本格式"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
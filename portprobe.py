@@ -0,0 +1,209 @@
+"""基于 asyncio 的非阻塞端口探测引擎
+
+异步代码可以直接 `await probe(ip, port)`；同步代码（Flask 请求线程、各个轮询脚本）
+通过 ProbeEngine 把探测提交到后台事件循环，一个进程即可同时挂起数千个探测：
+
+    from portprobe import get_engine
+    result = get_engine().check('1.2.3.4', 22, timeout=2)
+    for result in get_engine().check_many([('1.2.3.4', 22), ('5.6.7.8', 443)]):
+        print(result)
+"""
+import asyncio
+import queue
+import socket
+import threading
+import time
+from metrics import Counter, Gauge, Histogram
+
+DEFAULT_TIMEOUT = 1.0  # 默认连接超时（秒）
+MAX_TIMEOUT = 30.0  # 允许调用方设置的最大超时
+DEFAULT_MAX_IN_FLIGHT = 4096  # 引擎同时挂起的探测上限，注意不要超过进程的文件描述符上限
+MAX_ATTEMPTS = 10  # 多次探测判定时允许的最大次数
+MAX_PORT = 65535
+
+# 探测结果状态
+OPEN = 'open'
+CLOSED = 'closed'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+# 监控指标
+PROBES = Counter('portprobe_probes_total', 'Completed port probes by result status', ['status'])
+PROBE_LATENCY = Histogram('portprobe_connect_latency_seconds', 'Time spent in a single connect attempt', ['status'])
+PROBES_IN_FLIGHT = Gauge('portprobe_in_flight', 'Probes currently connecting')
+PROBES_WAITING = Gauge('portprobe_waiting', 'Probes queued for an engine slot')
+
+
+def clamp_timeout(timeout):
+    """把调用方传入的超时限制在 (0, MAX_TIMEOUT] 之间，None 表示使用默认值"""
+    if timeout is None:
+        return DEFAULT_TIMEOUT
+    timeout = float(timeout)
+    if timeout <= 0:
+        raise ValueError("timeout must be positive")
+    return min(timeout, MAX_TIMEOUT)
+
+
+def make_result(ip, port, status, latency, error=None):
+    result = {
+        'ip': ip,
+        'port': port,
+        'open': status == OPEN,
+        'status': status,
+        'latency_ms': round(latency * 1000, 3),
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+async def probe(ip, port, timeout=DEFAULT_TIMEOUT):
+    """用非阻塞 connect 探测一次 ip:port，返回结果字典（见 make_result）"""
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    sock = None
+    try:
+        sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+        status, error = OPEN, None
+    except asyncio.TimeoutError:
+        status, error = TIMEOUT, None
+    except ConnectionRefusedError:
+        status, error = CLOSED, None
+    except (OSError, ValueError, OverflowError) as e:  # 地址解析失败、端口超出范围等
+        status, error = ERROR, str(e)
+    finally:
+        if sock is not None:
+            sock.close()
+    return make_result(ip, port, status, time.monotonic() - start, error)
+
+
+class ProbeEngine:
+    """在后台线程中运行事件循环，供同步代码提交探测"""
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """返回后台事件循环，首次访问时启动后台线程"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='probe-engine', daemon=True).start()
+                    self._semaphore = asyncio.run_coroutine_threadsafe(
+                        self._make_semaphore(), loop).result()
+                    self._loop = loop
+        return self._loop
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_in_flight)
+
+    async def probe(self, ip, port, timeout=DEFAULT_TIMEOUT):
+        """受引擎全局并发上限约束的 probe，只能在引擎的事件循环中调用"""
+        PROBES_WAITING.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            PROBES_WAITING.dec()
+        PROBES_IN_FLIGHT.inc()
+        try:
+            result = await probe(ip, port, timeout)
+        finally:
+            PROBES_IN_FLIGHT.dec()
+            self._semaphore.release()
+        PROBES.inc(result['status'])
+        PROBE_LATENCY.observe(result['latency_ms'] / 1000, result['status'])
+        return result
+
+    async def probe_quorum(self, ip, port, attempts, quorum, timeout=DEFAULT_TIMEOUT):
+        """并发发起 attempts 次探测，至少 quorum 次成功判定为开放；结果一旦确定即取消其余探测"""
+        tasks = [asyncio.ensure_future(self.probe(ip, port, timeout)) for _ in range(attempts)]
+        start = time.monotonic()
+        results = []
+        opened = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                results.append({'status': result['status'], 'latency_ms': result['latency_ms']})
+                opened += result['open']
+                if opened >= quorum or len(results) - opened > attempts - quorum:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        if opened >= quorum:
+            status = OPEN
+        else:
+            statuses = {r['status'] for r in results}
+            status = next(s for s in (CLOSED, TIMEOUT, ERROR) if s in statuses)
+        verdict = make_result(ip, port, status, time.monotonic() - start)
+        verdict.update({'quorum': quorum, 'attempts': results})
+        return verdict
+
+    def run(self, coro):
+        """把协程提交到后台事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit(self, ip, port, timeout=DEFAULT_TIMEOUT):
+        """提交一次探测，返回 concurrent.futures.Future"""
+        return self.run(self.probe(ip, port, timeout))
+
+    def check(self, ip, port, timeout=DEFAULT_TIMEOUT):
+        """同步探测一次，阻塞直到得到结果"""
+        return self.submit(ip, port, timeout).result()
+
+    def submit_quorum(self, ip, port, attempts, quorum=1, timeout=DEFAULT_TIMEOUT):
+        """提交一次多次探测判定（见 probe_quorum），返回 concurrent.futures.Future"""
+        if not 1 <= quorum <= attempts <= MAX_ATTEMPTS:
+            raise ValueError(f"require 1 <= quorum <= attempts <= {MAX_ATTEMPTS}")
+        return self.run(self.probe_quorum(ip, port, attempts, quorum, timeout))
+
+    def check_quorum(self, ip, port, attempts, quorum=1, timeout=DEFAULT_TIMEOUT):
+        """同步的多次探测判定，见 probe_quorum"""
+        return self.submit_quorum(ip, port, attempts, quorum, timeout).result()
+
+    def check_many(self, targets, timeout=DEFAULT_TIMEOUT, concurrency=None):
+        """批量探测 [(ip, port), ...]，按完成顺序逐个产出结果"""
+        targets = list(targets)
+        results = queue.Queue()
+        self.run(self._probe_many(targets, timeout, concurrency or len(targets) or 1, results.put))
+        for _ in range(len(targets)):
+            yield results.get()
+
+    async def _probe_many(self, targets, timeout, concurrency, callback):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(ip, port):
+            async with semaphore:
+                try:
+                    result = await self.probe(ip, port, timeout)
+                except Exception as e:
+                    result = make_result(ip, port, ERROR, 0, str(e))
+                callback(result)
+
+        await asyncio.gather(*(bounded(ip, port) for ip, port in targets))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """返回进程内共享的 ProbeEngine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ProbeEngine()
+    return _engine
+
+
+def is_port_open(ip, port, timeout=DEFAULT_TIMEOUT):
+    """同步接口：端口开放返回 True，其余情况返回 False"""
+    return get_engine().check(ip, port, timeout)['open']